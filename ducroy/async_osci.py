@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+"""
+asyncio client for LeCroy Waverunner oscilloscopes.
+
+``AsyncOsci`` exposes the API of ``Osci`` as coroutines. The methods run in a
+dedicated thread per instrument, so the commands to one instrument stay in
+order while the event loop keeps serving other I/O. With the default
+``'vicp'`` transport the bytes are exchanged over a non-blocking asyncio
+socket (LeCroy VICP, TCP port 1861) owned by the event loop; the ``'visa'``
+transport falls back to the blocking pyvisa session inside the thread.
+
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import inspect
+
+from ducroy.osci_control import Osci
+from ducroy.transport import (VICP_PORT, VICP_HEADER, VICP_VERSION, VICP_DATA,
+                              VICP_REMOTE, VICP_EOI)
+
+
+class AsyncVicpConnection(object):
+    """Non-blocking VICP connection to an oscilloscope
+
+    Parameters
+    ----------
+    ip : str
+    port : int, optional
+    timeout : float, optional
+        timeout of every network operation in seconds
+    """
+
+    def __init__(self, ip, port=VICP_PORT, timeout=10.):
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self._sequence = 0
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.ip, self.port), self.timeout)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            if hasattr(self.writer, 'wait_closed'):
+                await self.writer.wait_closed()
+            self.reader = self.writer = None
+
+    async def write(self, data):
+        """Send one message, terminated with EOI"""
+        if isinstance(data, str):
+            data = data.encode('ascii')
+        self._sequence = self._sequence % 255 + 1
+        header = VICP_HEADER.pack(VICP_DATA | VICP_REMOTE | VICP_EOI,
+                                  VICP_VERSION, self._sequence, 0, len(data))
+        self.writer.write(header + data)
+        await asyncio.wait_for(self.writer.drain(), self.timeout)
+
+    async def read_raw(self):
+        """Receive one message (all blocks up to EOI) as bytes"""
+        blocks = []
+        while True:
+            header = await asyncio.wait_for(
+                self.reader.readexactly(VICP_HEADER.size), self.timeout)
+            operation, _, _, _, length = VICP_HEADER.unpack(header)
+            data = await asyncio.wait_for(self.reader.readexactly(length),
+                                          self.timeout)
+            if operation & VICP_DATA:
+                blocks.append(data)
+            if operation & VICP_EOI:
+                return b''.join(blocks)
+
+    async def query(self, command):
+        await self.write(command)
+        return (await self.read_raw()).decode('ascii')
+
+
+class _BlockingVicp(object):
+    """pyvisa like interface of an AsyncVicpConnection for the worker thread
+    of AsyncOsci, the I/O itself runs in the event loop"""
+
+    def __init__(self, connection, loop):
+        self.connection = connection
+        self.loop = loop
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def write(self, command):
+        return self._run(self.connection.write(command))
+
+    def read_raw(self):
+        return self._run(self.connection.read_raw())
+
+    def query(self, command):
+        return self._run(self.connection.query(command))
+
+
+class AsyncOsci(object):
+    """Coroutine version of Osci
+
+    All public methods of ``Osci`` are available as coroutines with the same
+    arguments, e.g. ``await osci.get_timebase()``. Command batches are
+    asynchronous context managers::
+
+        async with osci.batch() as batch:
+            await osci.set_timebase(1e-8)
+
+    Parameters
+    ----------
+    ip : str
+    transport : str, optional
+        'vicp' for an asyncio socket, 'visa' for pyvisa in a thread
+    timeout : float, optional
+        network timeout of the 'vicp' transport in seconds
+    """
+
+    def __init__(self, ip, transport='vicp', timeout=10.):
+        if transport not in ('vicp', 'visa'):
+            raise ValueError("Unknown transport {}".format(transport))
+        self.ip = ip
+        self.transport = transport
+        self.osci = Osci(ip, transport=transport)
+        self.connection = None
+        self._executor = None
+        if transport == 'vicp':
+            self.connection = AsyncVicpConnection(ip, timeout=timeout)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def _call(self, function, *args, **kwargs):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(function, *args, **kwargs))
+
+    async def open(self):
+        if self.connection is None:
+            await self._call(self.osci._open_resource)
+        else:
+            await self.connection.open()
+            self.osci.visa_if = _BlockingVicp(self.connection,
+                                              asyncio.get_event_loop())
+
+    async def close(self):
+        if self.connection is None:
+            if self.osci.visa_if is not None:
+                await self._call(self.osci.visa_if.close)
+        else:
+            await self.connection.close()
+        self.osci.visa_if = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def batch(self):
+        """Asynchronous version of Osci.batch, the batch is sent when the
+        async with block is left"""
+        return _AsyncBatch(self)
+
+
+class _AsyncBatch(object):
+    """Runs the Osci.batch context manager in the worker thread of
+    AsyncOsci, so the batch is sent without blocking the event loop"""
+
+    def __init__(self, async_osci):
+        self.async_osci = async_osci
+        self.context = None
+
+    async def __aenter__(self):
+        self.context = self.async_osci.osci.batch()
+        return await self.async_osci._call(self.context.__enter__)
+
+    async def __aexit__(self, *exc_info):
+        return await self.async_osci._call(self.context.__exit__, *exc_info)
+
+
+def _coroutine_method(name):
+    method = getattr(Osci, name)
+
+    @functools.wraps(method)
+    async def coroutine(self, *args, **kwargs):
+        return await self._call(getattr(self.osci, name), *args, **kwargs)
+    return coroutine
+
+
+# context managers and generators can not run in the worker thread
+for _name in dir(Osci):
+    if not _name.startswith('_') and callable(getattr(Osci, _name)) and \
+            not hasattr(AsyncOsci, _name) and \
+            not inspect.isgeneratorfunction(inspect.unwrap(
+                getattr(Osci, _name))):
+        setattr(AsyncOsci, _name, _coroutine_method(_name))
+del _name
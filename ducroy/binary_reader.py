@@ -2,11 +2,245 @@
 Binary data parser for LeCroy waverunner.
 
 """
-from struct import unpack
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from glob import glob
+
 import numpy as np
 
+WAVEDESC = b'WAVEDESC'
+WAVEDESC_SEARCH_LENGTH = 50
+
+_TIME_STAMP = [
+    ('seconds', 'f8'),
+    ('minutes', 'u1'),
+    ('hours', 'u1'),
+    ('days', 'u1'),
+    ('months', 'u1'),
+    ('year', 'i2'),
+    ('unused', 'i2'),
+]
+
+# Layout of the LECROY_2_3 wave descriptor, see the "Waveform template" of
+# the LeCroy remote control manual (TMPL? query)
+_WAVEDESC_FIELDS = [
+    ('descriptor_name', 'S16'),
+    ('template_name', 'S16'),
+    ('comm_type', 'i2'),
+    ('comm_order', 'i2'),
+    ('wave_descriptor', 'i4'),
+    ('user_text', 'i4'),
+    ('res_desc1', 'i4'),
+    ('trigtime_array', 'i4'),
+    ('ris_time_array', 'i4'),
+    ('res_array1', 'i4'),
+    ('wave_array_1', 'i4'),
+    ('wave_array_2', 'i4'),
+    ('res_array2', 'i4'),
+    ('res_array3', 'i4'),
+    ('instrument_name', 'S16'),
+    ('instrument_number', 'i4'),
+    ('trace_label', 'S16'),
+    ('reserved1', 'i2'),
+    ('reserved2', 'i2'),
+    ('wave_array_count', 'i4'),
+    ('pnts_per_screen', 'i4'),
+    ('first_valid_pnt', 'i4'),
+    ('last_valid_pnt', 'i4'),
+    ('first_point', 'i4'),
+    ('sparsing_factor', 'i4'),
+    ('segment_index', 'i4'),
+    ('subarray_count', 'i4'),
+    ('sweeps_per_acq', 'i4'),
+    ('points_per_pair', 'i2'),
+    ('pair_offset', 'i2'),
+    ('vertical_gain', 'f4'),
+    ('vertical_offset', 'f4'),
+    ('max_value', 'f4'),
+    ('min_value', 'f4'),
+    ('nominal_bits', 'i2'),
+    ('nom_subarray_count', 'i2'),
+    ('horiz_interval', 'f4'),
+    ('horiz_offset', 'f8'),
+    ('pixel_offset', 'f8'),
+    ('vertunit', 'S48'),
+    ('horunit', 'S48'),
+    ('horiz_uncertainty', 'f4'),
+    ('trigger_time', _TIME_STAMP),
+    ('acq_duration', 'f4'),
+    ('record_type', 'i2'),
+    ('processing_done', 'i2'),
+    ('reserved5', 'i2'),
+    ('ris_sweeps', 'i2'),
+    ('timebase', 'i2'),
+    ('vert_coupling', 'i2'),
+    ('probe_att', 'f4'),
+    ('fixed_vert_gain', 'i2'),
+    ('bandwidth_limit', 'i2'),
+    ('vertical_vernier', 'f4'),
+    ('acq_vert_offset', 'f4'),
+    ('wave_source', 'i2'),
+]
+
+
+def _byte_order(fields, fmt):
+    return [(name, _byte_order(code, fmt) if isinstance(code, list)
+             else fmt + code) for name, code in fields]
+
+
+WAVEDESC_DTYPES = {fmt: np.dtype(_byte_order(_WAVEDESC_FIELDS, fmt))
+                   for fmt in '<>'}
+WAVEDESC_SIZE = WAVEDESC_DTYPES['<'].itemsize
+
+
+class WaveDesc(object):
+    """Wave descriptor (WAVEDESC block) of a .trc file
+
+    All fields of the descriptor are available as attributes with lower case
+    names, e.g. ``header.vertical_gain``. String fields are decoded.
+
+    Parameters
+    ----------
+    record : np.void
+        a single record of one of the ``WAVEDESC_DTYPES``
+    offset : int
+        byte position of the WAVEDESC block inside the file
+    """
+
+    def __init__(self, record, offset=0):
+        self._record = record
+        self.offset = offset
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name not in self._record.dtype.names:
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, key):
+        value = self._record[key]
+        if isinstance(value, bytes):
+            return value.split(b'\x00', 1)[0].decode('ascii', 'replace')
+        if value.dtype.names is not None:
+            return value
+        return value.item()
+
+    def __repr__(self):
+        return "WaveDesc({}, {}, {} x {} {})".format(
+            self.instrument_name, self.wave_source_name, self.segments,
+            self.samples, self.sample_dtype)
+
+    @property
+    def endianness(self):
+        """Byte order character of the file, '<' or '>'"""
+        return self._record.dtype['comm_type'].str[0]
+
+    @property
+    def sample_dtype(self):
+        """dtype of the samples, int8 for COMM_TYPE 0 and int16 for 1"""
+        if self.comm_type == 1:
+            return np.dtype(self.endianness + 'i2')
+        return np.dtype('i1')
+
+    @property
+    def wave_source_name(self):
+        """Channel name of the wave source, e.g. 'C1'"""
+        return "C{}".format(self.wave_source + 1)
+
+    @property
+    def trigger_datetime(self):
+        """TRIGGER_TIME of the first segment as datetime"""
+        stamp = self.trigger_time
+        return datetime(stamp['year'], stamp['months'], stamp['days'],
+                        stamp['hours'], stamp['minutes']) + \
+            timedelta(seconds=stamp['seconds'].item())
+
+    @property
+    def segments(self):
+        """Number of segments (SUBARRAY_COUNT, or RESERVED1 * RESERVED2 if
+        NOM_SUBARRAY_COUNT is not set)"""
+        if self.nom_subarray_count == 0:
+            return self.reserved1 * self.reserved2
+        return self.subarray_count
 
-def read_timetrace(filename):
+    @property
+    def points(self):
+        """Total number of data points in the file"""
+        if self.nom_subarray_count == 0:
+            return self.wave_array_count
+        return self.wave_array_1 // self.sample_dtype.itemsize
+
+    @property
+    def samples(self):
+        """Number of data points per segment"""
+        return self.points // self.segments
+
+    @property
+    def trigtime_offset(self):
+        """Byte position of the trigger-time array inside the file"""
+        return self.offset + self.wave_descriptor + self.user_text
+
+    @property
+    def data_offset(self):
+        """Byte position of the first data point inside the file"""
+        return (self.trigtime_offset + self.trigtime_array +
+                self.ris_time_array + self.res_array1)
+
+
+def parse_header(buffer):
+    '''
+    Parse the wave descriptor from the beginning of a .trc file
+
+    Parameters
+    ----------
+    buffer : bytes
+        at least the first ``WAVEDESC_SEARCH_LENGTH + WAVEDESC_SIZE`` bytes
+        of the file
+
+    Returns
+    -------
+    WaveDesc
+
+    '''
+    offset = buffer.find(WAVEDESC, 0, WAVEDESC_SEARCH_LENGTH)
+    if offset < 0:
+        raise ValueError("No WAVEDESC block found")
+    if len(buffer) < offset + WAVEDESC_SIZE:
+        raise ValueError("Truncated WAVEDESC block")
+    fmt = '>' if buffer[offset + 34] == 0 else '<'  # COMM_ORDER
+    record = np.frombuffer(buffer, WAVEDESC_DTYPES[fmt], 1, offset)[0]
+    return WaveDesc(record, offset)
+
+
+def read_header(filename):
+    '''
+    Read only the wave descriptor of a .trc file
+
+    Parameters
+    ----------
+    filename : str
+
+    Returns
+    -------
+    WaveDesc
+
+    '''
+    with open(filename, "rb") as fid:
+        return parse_header(fid.read(WAVEDESC_SEARCH_LENGTH + WAVEDESC_SIZE))
+
+
+def _read_trigtimes(fid, header, start, count):
+    if header.trigtime_array == 0:
+        return None
+    dtype = np.dtype(header.endianness + 'f8')
+    fid.seek(header.trigtime_offset + start * 2 * dtype.itemsize, 0)
+    trigtimes = np.empty((count, 2), dtype)
+    nbytes = fid.readinto(memoryview(trigtimes).cast('B'))
+    if nbytes != trigtimes.nbytes:
+        raise ValueError("Trigger time array is truncated")
+    return trigtimes
+
+
+def read_timetrace(filename, memmap=False, trigtimes=False):
     '''
     Read binary waveform file (.trc) from LeCroy waverunner
     Based on Matlab file LCREAD.m
@@ -14,40 +248,157 @@ def read_timetrace(filename):
     Parameters
     ----------
     filename : str
+    memmap : bool, optional
+        If True, ``y`` is a read-only ``np.memmap`` view of the sample block
+        on disk instead of an in-memory copy, and ``x`` is the time axis
+        ``h_off + i * h_int`` broadcast to the shape of ``y`` (only one row
+        is actually stored).
+    trigtimes : bool, optional
+        If True, the trigger-time array is decoded and appended to the
+        returned values as a (segments, 2) float64 array holding trigger
+        time and trigger offset of every segment (None if the file has no
+        trigger-time array).
 
     Returns
     -------
-    x, y, v_gain, v_off, h_int, h_off
-
-    '''
-    fid = open(filename, "rb")
-    data = fid.read(50).decode('ascii')
-    offset = str.find(data, 'WAVEDESC')
-    fid.seek(offset + 32, 0)
-
-    COMM_TYPE = unpack('<h', fid.read(2))  # noqa
-    fmt = '>' if ord(fid.read(1)) == 0 else '<'  # endianness
-    fid.read(1)
-    wave_descriptor = unpack(fmt + 'l', fid.read(4))[0]
-    data = unpack(fmt + '6l', fid.read(6*4))
-    user_text, _, trigtime_array, _, _, wave_array_1 = data
-    fid.read(48)
-    res1, res2, wave_array_count = unpack(fmt + 'hhl', fid.read(8))
-    fid.read(24)
-    subarray_count, _, _, v_gain, v_off = unpack(fmt + '3lff', fid.read(5*4))
-    fid.read(10)
-    nom_subarray_count, h_int, h_off = unpack(fmt + 'hfd', fid.read(2+4+8))
-
-    if nom_subarray_count == 0:
-        subarray_count = res1 * res2
-        wave_array_1 = wave_array_count  # TOTAL number of datapoints
-
-    fid.seek(offset + wave_descriptor + user_text + trigtime_array, 0)
-    y = np.frombuffer(fid.read(wave_array_1), 'b', wave_array_1)
+    x, y, v_gain, v_off, h_int, h_off[, trigtimes]
+        Without memmap ``x`` is the 1-based sample index counted through
+        all segments.
+
+    '''
+    header = read_header(filename)
+    segments, samples = header.segments, header.samples
+    v_gain, v_off = header.vertical_gain, header.vertical_offset
+    h_int, h_off = header.horiz_interval, header.horiz_offset
+
+    with open(filename, "rb") as fid:
+        if trigtimes:
+            trigtimes = (_read_trigtimes(fid, header, 0, segments),)
+        else:
+            trigtimes = ()
+
+        if memmap:
+            y = np.memmap(filename, dtype=header.sample_dtype, mode='r',
+                          offset=header.data_offset,
+                          shape=(segments, samples))
+            x = np.broadcast_to(h_off + h_int * np.arange(samples),
+                                (segments, samples))
+            return (x, y, v_gain, v_off, h_int, h_off) + trigtimes
+
+        fid.seek(header.data_offset, 0)
+        count = segments * samples
+        y = np.frombuffer(fid.read(count * header.sample_dtype.itemsize),
+                          header.sample_dtype, count)
     x = np.arange(1, len(y) + 1)  # *h_int + h_off
 
-    fid.close()
+    return (x.reshape(segments, samples),
+            y.reshape(segments, samples),
+            v_gain, v_off, h_int, h_off) + trigtimes
+
+
+def iter_timetrace(filename, segments_per_block=1000):
+    '''
+    Iterate over the segments of a binary waveform file (.trc) in blocks
+
+    Only one block of segments is held in memory at a time, so files larger
+    than the memory can be processed.
+
+    Parameters
+    ----------
+    filename : str
+    segments_per_block : int, optional
+        number of segments per block, the last block may be shorter
+
+    Yields
+    ------
+    y, trigtimes, v_gain, v_off, h_int, h_off
+        y has the shape (segments_in_block, samples), trigtimes has the
+        shape (segments_in_block, 2) and holds trigger time and trigger
+        offset of every segment (None if the file has no trigger-time array)
+
+    '''
+    header = read_header(filename)
+    segments, samples = header.segments, header.samples
+    calibration = (header.vertical_gain, header.vertical_offset,
+                   header.horiz_interval, header.horiz_offset)
+    with open(filename, "rb") as fid:
+        for start in range(0, segments, segments_per_block):
+            count = min(segments_per_block, segments - start)
+            trigtimes = _read_trigtimes(fid, header, start, count)
+            y = np.empty((count, samples), header.sample_dtype)
+            fid.seek(header.data_offset + start * samples * y.itemsize, 0)
+            if fid.readinto(memoryview(y).cast('B')) != y.nbytes:
+                raise ValueError("{} is truncated".format(filename))
+            yield (y, trigtimes) + calibration
+
+
+def _read_samples_into(filename, header, out):
+    with open(filename, "rb") as fid:
+        fid.seek(header.data_offset, 0)
+        nbytes = fid.readinto(memoryview(out).cast('B'))
+    if nbytes != out.nbytes:
+        raise ValueError("{} is truncated".format(filename))
+
+
+def _read_samples(filename):
+    return read_timetrace(filename)[1]
+
+
+def read_timetraces(filenames, max_workers=None, processes=False):
+    '''
+    Read many binary waveform files (.trc) into one array
+
+    All files have to share the number of segments, samples and the sample
+    format. The samples are written into a single preallocated array, the
+    files are read in parallel.
+
+    Parameters
+    ----------
+    filenames : str or list of str
+        a glob pattern or a list of file names
+    max_workers : int, optional
+        size of the worker pool
+    processes : bool, optional
+        use a process pool instead of a thread pool. Threads read directly
+        into the output array, processes have to send the samples back.
+
+    Returns
+    -------
+    y, v_gain, v_off, h_int, h_off
+        y has the shape (files * segments, samples), the others are arrays
+        with one entry per file
+
+    '''
+    if isinstance(filenames, str):
+        filenames = sorted(glob(filenames))
+    if len(filenames) == 0:
+        raise ValueError("No files to read")
+
+    with ThreadPoolExecutor(max_workers) as executor:
+        headers = list(executor.map(read_header, filenames))
+
+    first = headers[0]
+    segments, samples = first.segments, first.samples
+    for filename, header in zip(filenames, headers):
+        if (header.segments, header.samples, header.sample_dtype) != \
+                (segments, samples, first.sample_dtype):
+            raise ValueError("{} is not compatible with {}".format(
+                filename, filenames[0]))
+
+    y = np.empty((len(filenames) * segments, samples), first.sample_dtype)
+    blocks = [y[i * segments:(i + 1) * segments]
+              for i in range(len(filenames))]
+    if processes:
+        with ProcessPoolExecutor(max_workers) as executor:
+            for block, data in zip(blocks, executor.map(_read_samples,
+                                                        filenames)):
+                block[:] = data
+    else:
+        with ThreadPoolExecutor(max_workers) as executor:
+            list(executor.map(_read_samples_into, filenames, headers, blocks))
 
-    return (x.reshape(subarray_count, wave_array_1 // subarray_count),
-            y.reshape(subarray_count, wave_array_1 // subarray_count),
-            v_gain, v_off, h_int, h_off)
+    v_gain = np.array([h.vertical_gain for h in headers])
+    v_off = np.array([h.vertical_offset for h in headers])
+    h_int = np.array([h.horiz_interval for h in headers])
+    h_off = np.array([h.horiz_offset for h in headers])
+    return y, v_gain, v_off, h_int, h_off
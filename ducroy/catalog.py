@@ -0,0 +1,197 @@
+"""
+Persistent header index for directories of LeCroy waverunner binary files.
+
+The WAVEDESC fields of every .trc file are stored in a SQLite database, so
+files can be looked up by channel, timebase, segment count or acquisition
+time without opening them again.
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sqlite3
+
+import numpy as np
+
+from ducroy.binary_reader import WAVEDESC_DTYPES, read_header
+
+_SQL_TYPES = {'S': 'TEXT', 'i': 'INTEGER', 'u': 'INTEGER', 'f': 'REAL'}
+
+HEADER_COLUMNS = [(name, _SQL_TYPES[WAVEDESC_DTYPES['<'][name].kind])
+                  for name in WAVEDESC_DTYPES['<'].names
+                  if WAVEDESC_DTYPES['<'][name].names is None]
+EXTRA_COLUMNS = [
+    ('channel', 'TEXT'),
+    ('segments', 'INTEGER'),
+    ('samples', 'INTEGER'),
+    ('trigger_datetime', 'TEXT'),
+]
+FILE_COLUMNS = [
+    ('path', 'TEXT PRIMARY KEY'),
+    ('mtime', 'REAL'),
+    ('size', 'INTEGER'),
+]
+INDEXED_COLUMNS = ['channel', 'segments', 'horiz_interval', 'trigger_datetime']
+
+
+def _header_row(filename):
+    try:
+        header = read_header(filename)
+    except (OSError, ValueError):
+        return None
+    row = []
+    for name, _ in HEADER_COLUMNS:
+        value = header[name]
+        if WAVEDESC_DTYPES['<'][name].kind == 'f':
+            # shortest decimal representation of the float32 value, so
+            # that e.g. horiz_interval=2e-10 can be queried directly
+            value = float(str(np.float32(value)))
+        row.append(value)
+    try:
+        trigger_datetime = header.trigger_datetime.isoformat(' ')
+    except ValueError:
+        # invalid TRIGGER_TIME, e.g. month 0
+        trigger_datetime = None
+    row += [header.wave_source_name, header.segments, header.samples,
+            trigger_datetime]
+    return row
+
+
+class TrcCatalog(object):
+    """SQLite index of the wave descriptors of .trc files
+
+    Parameters
+    ----------
+    filepath : str
+        SQLite database, created if it does not exist
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.columns = FILE_COLUMNS + HEADER_COLUMNS + EXTRA_COLUMNS
+        self.connection = sqlite3.connect(filepath)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS headers ({})"
+                                    .format(", ".join(
+                                        " ".join(c) for c in self.columns)))
+            for column in INDEXED_COLUMNS:
+                self.connection.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_{0} ON headers ({0})"
+                    .format(column))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM headers").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def update(self, directory, extension='.trc', max_workers=None):
+        '''
+        Index all files below a directory
+
+        Only new files and files whose modification time or size changed are
+        read, entries of files which no longer exist are removed.
+
+        Parameters
+        ----------
+        directory : str
+        extension : str, optional
+        max_workers : int, optional
+            number of threads reading the headers
+
+        Returns
+        -------
+        updated, removed : int
+            number of (re)indexed and removed files
+
+        '''
+        prefix = os.path.join(os.path.abspath(directory), '')
+        known = {path: (mtime, size) for path, mtime, size in
+                 self.connection.execute(
+                     "SELECT path, mtime, size FROM headers "
+                     "WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))}
+
+        found = dict()
+        for root, _, filenames in os.walk(prefix):
+            for filename in filenames:
+                if filename.endswith(extension):
+                    path = os.path.join(root, filename)
+                    stat = os.stat(path)
+                    found[path] = (stat.st_mtime, stat.st_size)
+
+        changed = [path for path, stat in found.items()
+                   if known.get(path) != stat]
+        removed = [(path,) for path in known if path not in found]
+        with ThreadPoolExecutor(max_workers) as executor:
+            rows = [[path] + list(found[path]) + row for path, row in
+                    zip(changed, executor.map(_header_row, changed))
+                    if row is not None]
+
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM headers WHERE path = ?", removed)
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO headers VALUES ({})".format(
+                    ", ".join("?" * len(self.columns))), rows)
+        return len(rows), len(removed)
+
+    def query(self, where=None, params=(), **conditions):
+        '''
+        Find files by header values
+
+        Keyword conditions are combined with AND. A tuple value selects a
+        closed range, e.g. ``trigger_datetime=('2017-12-12', '2017-12-13')``.
+
+        Parameters
+        ----------
+        where : str, optional
+            additional SQL condition, e.g. ``"path LIKE '%1300V%'"``
+        params : tuple, optional
+            parameters of the SQL condition
+        conditions : column=value
+
+        Returns
+        -------
+        paths : list of str
+
+        '''
+        clauses, values = [], []
+        for column, value in conditions.items():
+            if column not in dict(self.columns):
+                raise ValueError("Unknown column {}".format(column))
+            if isinstance(value, tuple):
+                clauses.append("{} BETWEEN ? AND ?".format(column))
+                values += list(value)
+            else:
+                clauses.append("{} = ?".format(column))
+                values.append(value)
+        if where is not None:
+            clauses.append("({})".format(where))
+            values += list(params)
+        sql = "SELECT path FROM headers"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY path"
+        return [row[0] for row in self.connection.execute(sql, values)]
+
+    def get_header(self, path):
+        '''
+        Indexed header values of a single file
+
+        Returns
+        -------
+        header : dict
+
+        '''
+        cursor = self.connection.execute(
+            "SELECT * FROM headers WHERE path = ?", (os.path.abspath(path),))
+        row = cursor.fetchone()
+        if row is None:
+            raise KeyError(path)
+        return dict(zip([c[0] for c in self.columns], row))
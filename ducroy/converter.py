@@ -0,0 +1,218 @@
+"""
+Bulk converter from LeCroy waverunner binary files (.trc) to HDF5.
+
+The files are read and compressed in worker processes while the main process
+writes the compressed chunks into a resizable dataset, using the
+``/raw_data/<HV>V/<name>`` layout of ``PmtData``.
+
+"""
+import argparse
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+import time
+import zlib
+
+import h5py
+import numpy as np
+
+from ducroy.binary_reader import read_header, read_timetrace
+
+CHUNK_BYTES = 2**20
+RAW_DATA_GROUP = "/raw_data/{0:.0f}V/{1}"
+CALIBRATION_ATTRS = (u'vertical_gain', u'vertical_offset',
+                     u'horizontal_interval', u'horizontal_offset')
+
+
+def _chunk_segments(samples, itemsize, chunk_bytes=CHUNK_BYTES):
+    """Number of waveforms of chunks not bigger than chunk_bytes"""
+    return max(chunk_bytes // max(samples * itemsize, 1), 1)
+
+
+def _same_calibration(calibration, other):
+    """Relative comparison of (v_gain, v_off, h_int, h_off), the absolute
+    tolerance of np.allclose would hide different time bases"""
+    return np.allclose(calibration, other, rtol=1e-6, atol=0)
+
+
+def _direct_chunks(dataset):
+    """Whether zlib compressed chunks can be written without the filters"""
+    return dataset.compression == 'gzip' and not dataset.shuffle and \
+        not dataset.fletcher32 and dataset.scaleoffset is None
+
+
+def _compress_trc(filename, start, chunk_segments, level):
+    """Read a file which starts at row start of the dataset and compress the
+    chunks which lie completely inside of it. The rows before and after them
+    (head and tail) are returned uncompressed, level None returns all rows
+    as head."""
+    _, y, v_gain, v_off, h_int, h_off = read_timetrace(filename)
+    if level is None:
+        head, body, tail = y, y[:0], y[:0]
+    else:
+        first = min(-start % chunk_segments, len(y))
+        stop = first + (len(y) - first) // chunk_segments * chunk_segments
+        head, body, tail = y[:first], y[first:stop], y[stop:]
+    chunks = [zlib.compress(body[i:i + chunk_segments].tobytes(), level)
+              for i in range(0, len(body), chunk_segments)]
+    return y.shape, y.dtype.str, (v_gain, v_off, h_int, h_off), head, \
+        chunks, tail
+
+
+def convert_trc_to_hdf5(filenames, filepath, hv, name, comment='',
+                        max_workers=None, level=4):
+    '''
+    Convert binary waveform files (.trc) into one HDF5 dataset
+
+    The samples are stored in the dataset ``/raw_data/<hv>V/<name>/data``,
+    which is chunked, gzip compressed and resizable along the waveform axis.
+    The chunks span file boundaries, so files with few segments, e.g. single
+    waveforms, are stored in chunks of about 1 MB as well. Complete chunks
+    are compressed by the workers, the chunks at file boundaries by h5py.
+    If the dataset already exists, the waveforms are appended, also to
+    datasets of ``PmtData.add_waveforms``. All files need the same number of
+    segments, samples and the same calibration.
+
+    Parameters
+    ----------
+    filenames : str or list of str
+        a glob pattern or a list of file names
+    filepath : str
+        HDF5 file, created if it does not exist
+    hv : float
+        high voltage of the measurement
+    name : str
+        name of the data set
+    comment : str, optional
+    max_workers : int, optional
+        number of worker processes reading and compressing the files
+    level : int, optional
+        gzip compression level
+
+    Returns
+    -------
+    stats : dict
+        number of files, waveforms, uncompressed bytes, seconds and MB/s
+
+    '''
+    start_time = time.time()
+    if isinstance(filenames, str):
+        filenames = sorted(glob(filenames))
+    if len(filenames) == 0:
+        raise ValueError("No files to convert")
+
+    header = read_header(filenames[0])
+    segments, samples = header.segments, header.samples
+    dtype = header.sample_dtype
+    calibration = (header.vertical_gain, header.vertical_offset,
+                   header.horiz_interval, header.horiz_offset)
+
+    with h5py.File(filepath, "a") as file:
+        dataset_group = file.require_group(RAW_DATA_GROUP.format(hv, name))
+        if u'data' in dataset_group:
+            dataset = dataset_group[u'data']
+            if dataset.ndim != 2 or dataset.shape[1] != samples or \
+                    dataset.dtype != dtype or dataset.chunks is None or \
+                    dataset.maxshape[0] is not None:
+                raise ValueError("Existing dataset is not compatible")
+            # PmtData stores only the gain and the interval
+            stored = [dataset_group.attrs.get(key, value)
+                      for key, value in zip(CALIBRATION_ATTRS, calibration)]
+            if not _same_calibration(calibration, stored):
+                raise ValueError("Existing dataset has a different "
+                                 "calibration")
+        else:
+            dataset = dataset_group.create_dataset(
+                u'data', shape=(0, samples), maxshape=(None, samples),
+                dtype=dtype,
+                chunks=(_chunk_segments(samples, dtype.itemsize), samples),
+                compression='gzip', compression_opts=level)
+            dataset_group.attrs[u'comment'] = comment
+        for key, value in zip(CALIBRATION_ATTRS, calibration):
+            dataset_group.attrs[key] = value
+
+        chunk_segments = dataset.chunks[0]
+        file_level = level if _direct_chunks(dataset) else None
+        row = len(dataset)
+        buffer = []
+        queue_length = 2 * (max_workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers) as executor:
+            pending = deque()
+            for i, filename in enumerate(filenames):
+                pending.append((filename, executor.submit(
+                    _compress_trc, filename, row + i * segments,
+                    chunk_segments, file_level)))
+                if len(pending) >= queue_length:
+                    row = _write_chunks(dataset, row, buffer, segments,
+                                        calibration, dtype,
+                                        *pending.popleft())
+            while pending:
+                row = _write_chunks(dataset, row, buffer, segments,
+                                    calibration, dtype, *pending.popleft())
+        _flush(dataset, row, buffer)
+
+    seconds = time.time() - start_time
+    nbytes = len(filenames) * segments * samples * dtype.itemsize
+    return {'files': len(filenames),
+            'waveforms': len(filenames) * segments,
+            'bytes': nbytes,
+            'seconds': seconds,
+            'mb_per_s': nbytes / 1e6 / seconds if seconds > 0 else np.inf}
+
+
+def _flush(dataset, row, buffer):
+    """Write the buffered rows, which end at row, through h5py"""
+    if buffer:
+        rows = np.concatenate(buffer)
+        dataset[row - len(rows):row] = rows
+        del buffer[:]
+
+
+def _write_chunks(dataset, row, buffer, segments, calibration, dtype,
+                  filename, future):
+    shape, dtype_str, file_calibration, head, chunks, tail = future.result()
+    chunk_segments = dataset.chunks[0]
+    if shape[0] != segments or shape[1] != dataset.shape[1] or \
+            np.dtype(dtype_str) != dtype:
+        raise ValueError("{} is not compatible".format(filename))
+    if not _same_calibration(file_calibration, calibration):
+        raise ValueError("{} has a different calibration".format(filename))
+    dataset.resize(row + shape[0], axis=0)
+    buffer.append(head)
+    row += len(head)
+    if row % chunk_segments == 0 or \
+            sum(len(rows) for rows in buffer) >= chunk_segments:
+        _flush(dataset, row, buffer)
+    for chunk in chunks:
+        dataset.id.write_direct_chunk((row, 0), chunk)
+        row += chunk_segments
+    if len(tail):
+        buffer.append(tail)
+        row += len(tail)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert LeCroy .trc files into a PmtData HDF5 file")
+    parser.add_argument('filepath', help="HDF5 output file")
+    parser.add_argument('hv', type=float, help="high voltage [V]")
+    parser.add_argument('name', help="name of the data set")
+    parser.add_argument('filenames', nargs='+', help=".trc files")
+    parser.add_argument('-c', '--comment', default='')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of worker processes")
+    parser.add_argument('-l', '--level', type=int, default=4,
+                        help="gzip compression level")
+    args = parser.parse_args()
+
+    stats = convert_trc_to_hdf5(args.filenames, args.filepath, args.hv,
+                                args.name, args.comment, args.jobs,
+                                args.level)
+    print("Converted {files} files ({waveforms} waveforms) in {seconds:.1f} s"
+          ", {mb_per_s:.1f} MB/s".format(**stats))
+
+
+if __name__ == '__main__':
+    main()
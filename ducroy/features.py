@@ -0,0 +1,66 @@
+"""
+Per-waveform features of int8 waveform blocks.
+
+A reducer is a callable which maps the waveforms of one readout, an int8
+array of shape (segments, samples), onto a structured array with one entry
+per waveform. ``FeatureExtractor`` is the default reducer of
+``Osci.aquire_features``, any other callable with the same signature can be
+used instead.
+
+"""
+import numpy as np
+
+from ducroy.processing import PULSE_DTYPE, pulse_features
+
+FEATURE_DTYPE = np.dtype([
+    ('pedestal', np.float32),
+    ('charge', np.float32),
+    ('amplitude', np.float32),
+    ('peak_sample', np.int16),
+    ('time_over_threshold', np.int16),
+])
+
+
+class FeatureExtractor(object):
+    """Baseline, windowed integral, peak amplitude and time over threshold
+
+    All features are in ADC counts (charge in ADC counts times samples) and
+    relative to the pedestal, the mean of the baseline window. The sign is
+    chosen such that pulses of the given polarity give positive values.
+
+    Parameters
+    ----------
+    baseline_window : tuple of int
+        (start, stop) samples of the pedestal
+    integration_window : tuple of int
+        (start, stop) samples of the charge, amplitude and time over threshold
+    threshold : float, optional
+        threshold of the time over threshold in ADC counts above the pedestal
+    polarity : int, optional
+        -1 for negative (PMT) pulses, 1 for positive pulses
+    """
+
+    def __init__(self, baseline_window, integration_window, threshold=5.,
+                 polarity=-1):
+        if polarity not in (-1, 1):
+            raise ValueError("polarity has to be -1 or 1")
+        self.baseline_window = baseline_window
+        self.integration_window = integration_window
+        self.threshold = threshold
+        self.polarity = polarity
+
+    def __call__(self, waveforms):
+        pulses = pulse_features(waveforms, self.baseline_window,
+                                self.integration_window, self.polarity)
+        features = np.empty(len(waveforms), FEATURE_DTYPE)
+        for name in PULSE_DTYPE.names:
+            features[name] = pulses[name]
+        window = waveforms[:, slice(*self.integration_window)]
+        level = pulses['pedestal'] + np.float32(self.polarity * self.threshold)
+        if self.polarity < 0:
+            features['time_over_threshold'] = (
+                window < level[:, None]).sum(axis=1)
+        else:
+            features['time_over_threshold'] = (
+                window > level[:, None]).sum(axis=1)
+        return features
@@ -0,0 +1,213 @@
+"""
+Gain analysis of high voltage scans stored in PmtData files.
+
+For every high voltage with raw data the charges are integrated, histogrammed
+and fitted in a process pool. The histograms and fit results are written into
+the ``analysis`` group of the file, the gains are fitted with a power law
+``gain = a * hv**b``, which gives the measured nominal voltage (the voltage of
+the nominal gain) and the measured gain at the nominal voltage.
+
+"""
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+import os
+
+import h5py
+import numpy as np
+
+from ducroy.pmt_data import PmtData
+from ducroy.processing import integrate_charge
+from ducroy.spectrum_fit import fit_charge_spectrum
+
+
+def _raw_data_voltages(filepath):
+    with h5py.File(filepath, "r") as file:
+        if u'raw_data' not in file:
+            return []
+        return sorted(int(key.rstrip('V')) for key in file[u'raw_data'])
+
+
+def _analyse_voltage(filepath, hv, baseline_window, window, bins,
+                     charge_range, polarity, fit_options):
+    charges = []
+    with h5py.File(filepath, "r") as file:
+        voltage_group = file[u'raw_data/{:.0f}V'.format(hv)]
+        for name in sorted(voltage_group):
+            dataset_group = voltage_group[name]
+            attrs = dataset_group.attrs
+            charges.append(integrate_charge(
+                dataset_group[u'data'], window, attrs[u'vertical_gain'],
+                attrs[u'horizontal_interval'], baseline_window,
+                attrs.get(u'vertical_offset', 0.), polarity=polarity))
+    charges = np.concatenate(charges)
+    if charge_range is None:
+        charge_range = tuple(np.percentile(charges, [0.01, 99.9]))
+    y, edges = np.histogram(charges, bins=bins, range=charge_range)
+    x = (edges[1:] + edges[:-1]) / 2
+    return hv, x, y, fit_charge_spectrum(x, y, **fit_options)
+
+
+def fit_gain_curve(voltages, gains, gain_errors=None):
+    '''
+    Fit the power law ``gain = a * hv**b`` in log-log space
+
+    Parameters
+    ----------
+    voltages, gains : array_like
+    gain_errors : array_like, optional
+        used as weights
+
+    Returns
+    -------
+    a, b : float
+    covariance : ndarray, shape (2, 2)
+        covariance of (log(a), b)
+
+    '''
+    log_hv = np.log(np.asarray(voltages, dtype=np.float64))
+    log_gain = np.log(np.asarray(gains, dtype=np.float64))
+    if gain_errors is None:
+        weights = np.ones_like(log_hv)
+    else:
+        weights = np.asarray(gains) / np.asarray(gain_errors)
+    design = np.stack([np.ones_like(log_hv), log_hv], axis=1) * \
+        weights[:, None]
+    covariance = np.linalg.inv(design.T.dot(design))
+    log_a, b = covariance.dot(design.T.dot(log_gain * weights))
+    if gain_errors is None and len(log_hv) > 2:
+        residuals = log_gain - log_a - b * log_hv
+        covariance *= (residuals**2).sum() / (len(log_hv) - 2)
+    return np.exp(log_a), b, covariance
+
+
+def _nominal_values(nominal_voltage, nominal_gain, a, b, covariance):
+    log_a = np.log(a)
+    log_voltage = (np.log(nominal_gain) - log_a) / b
+    gradient = np.array([-1. / b, -log_voltage / b])
+    voltage = np.exp(log_voltage)
+    voltage_err = voltage * np.sqrt(gradient.dot(covariance).dot(gradient))
+    gradient = np.array([1., np.log(nominal_voltage)])
+    gain = a * nominal_voltage**b
+    gain_err = gain * np.sqrt(gradient.dot(covariance).dot(gradient))
+    return voltage, voltage_err, gain, gain_err
+
+
+def _submit(executor, filepath, baseline_window, window, bins, charge_range,
+            polarity, fit_options):
+    return [executor.submit(_analyse_voltage, filepath, hv, baseline_window,
+                            window, bins, charge_range, polarity, fit_options)
+            for hv in _raw_data_voltages(filepath)]
+
+
+def _store(filepath, futures):
+    # the workers have to close the file before it is opened for writing
+    outputs = [future.result() for future in futures]
+    with PmtData.read_from_file(filepath) as pmt_data:
+        return _store_results(pmt_data, outputs)
+
+
+def _store_results(pmt_data, outputs):
+    results = dict()
+    for hv, x, y, fit in outputs:
+        pmt_data.add_histogram(hv, x, y)
+        pmt_data.add_fit_results(hv, fit[u'used_gaussians'], fit[u'nphe'],
+                                 fit[u'q0'], fit[u'q0sigma'], fit[u'q1'],
+                                 fit[u'q1sigma'], fit[u'gain'],
+                                 fit[u'gain_err'])
+        results[hv] = fit
+
+    retval = {u'fits': results}
+    if len(results) >= 2:
+        voltages = sorted(results)
+        a, b, covariance = fit_gain_curve(
+            voltages, [results[hv][u'gain'] for hv in voltages],
+            [results[hv][u'gain_err'] for hv in voltages])
+        voltage, voltage_err, gain, gain_err = _nominal_values(
+            pmt_data.nominal_voltage, pmt_data.nominal_gain, a, b,
+            covariance)
+        pmt_data.measured_nominal_voltage = voltage
+        pmt_data.measured_nominal_voltage_error = voltage_err
+        pmt_data.measured_nominal_gain = gain
+        pmt_data.measured_nominal_gain_error = gain_err
+        retval.update({u'a': a, u'b': b,
+                       u'measured_nominal_voltage': voltage,
+                       u'measured_nominal_voltage_err': voltage_err,
+                       u'measured_nominal_gain': gain,
+                       u'measured_nominal_gain_err': gain_err})
+    return retval
+
+
+def analyse_pmt(filepath, baseline_window, window, bins=200,
+                charge_range=None, polarity=-1, max_workers=None,
+                **fit_options):
+    '''
+    Gain analysis of all high voltages of a PmtData file
+
+    The charges of all raw data sets of a high voltage are histogrammed
+    together. Histograms and fit results are overwritten, the measured
+    nominal voltage and gain are set if at least two voltages are fitted.
+
+    Parameters
+    ----------
+    filepath : str
+        PmtData file
+    baseline_window : tuple of int
+        (start, stop) samples of the baseline
+    window : tuple of int
+        (start, stop) samples of the charge integral
+    bins : int, optional
+        number of bins of the charge histograms
+    charge_range : tuple of float, optional
+        range of the histograms in pC, by default the 0.01 to 99.9
+        percentile of the charges
+    polarity : int, optional
+        -1 for negative pulses, 1 for positive pulses
+    max_workers : int, optional
+        number of worker processes
+    fit_options
+        further arguments of ``fit_charge_spectrum``
+
+    Returns
+    -------
+    results : dict
+        the fit results per high voltage ('fits'), the power law parameters
+        ('a', 'b') and the measured nominal values with errors
+
+    '''
+    return analyse_directory([filepath], baseline_window, window, bins,
+                             charge_range, polarity, max_workers,
+                             **fit_options)[filepath]
+
+
+def analyse_directory(filepaths, baseline_window, window, bins=200,
+                      charge_range=None, polarity=-1, max_workers=None,
+                      **fit_options):
+    '''
+    Gain analysis of many PmtData files with one process pool
+
+    All high voltages of all files are analysed in parallel, the results of a
+    file are written as soon as all of its voltages are done.
+
+    Parameters
+    ----------
+    filepaths : str or list of str
+        a directory, whose .h5 files are analysed, or a list of files
+    baseline_window, window, bins, charge_range, polarity, max_workers,
+    fit_options
+        see ``analyse_pmt``
+
+    Returns
+    -------
+    results : dict
+        results of ``analyse_pmt`` per file
+
+    '''
+    if isinstance(filepaths, str):
+        filepaths = sorted(glob(os.path.join(filepaths, '*.h5')))
+    with ProcessPoolExecutor(max_workers) as executor:
+        futures = [(filepath, _submit(executor, filepath, baseline_window,
+                                      window, bins, charge_range, polarity,
+                                      fit_options))
+                   for filepath in filepaths]
+        return {filepath: _store(filepath, pending)
+                for filepath, pending in futures}
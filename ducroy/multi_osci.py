@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Parallel acquisition with several LeCroy Waverunner oscilloscopes.
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import numpy as np
+
+from ducroy.osci_control import Osci
+
+
+class OsciGroup(object):
+    """Drives several oscilloscopes concurrently, one thread per scope
+
+    Parameters
+    ----------
+    ips : list of str
+    """
+
+    def __init__(self, ips):
+        self.ips = list(ips)
+        self.oscis = [Osci(ip) for ip in self.ips]
+        self.acquisition_stats = None
+
+    def open(self):
+        self.map(lambda osci: osci._open_resource())
+
+    def map(self, function):
+        """Calls function(osci) for every oscilloscope in parallel
+        Returns
+        -------
+        results: list with the return values in the order of the ips
+        """
+        with ThreadPoolExecutor(max_workers=len(self.oscis)) as executor:
+            futures = [executor.submit(function, osci) for osci in self.oscis]
+            return [future.result() for future in futures]
+
+    def aquire_waveforms(self, channels, number_of_waveforms,
+                         shared_trigger=None, pmt_data=None, hv=None,
+                         name='waveforms', pipelined=False, keep=True):
+        """Aquire waveforms on all oscilloscopes at the same time
+        Parameters
+        ----------
+        channels (string): list of channels where the data to read from
+        number_of_waveforms (int): the amount of waveforms per oscilloscope
+        shared_trigger (string): trigger source which all oscilloscopes
+        share, e.g. 'EX'. If given, the oscilloscopes are switched to this
+        source and armed together before every sequence.
+        pmt_data: list with one PmtData per oscilloscope, every readout is
+        appended there as soon as it arrives, as /raw_data/<hv>V/<name>
+        (<name>_<channel> for more than one channel)
+        hv: high voltage, needed for pmt_data
+        name: name of the data set in pmt_data
+        pipelined: see Osci.aquire_waveforms
+        keep (bool): return the waveforms, if False they are only written
+        to pmt_data and the run is not limited by the memory
+        Returns
+        -------
+        sequences: dict ip -> dict channel -> two dimensional array with the
+        waveforms as ADC values (empty if keep is False)
+        Per scope throughput is stored in acquisition_stats.
+        """
+        if pmt_data is not None:
+            if len(pmt_data) != len(self.oscis):
+                raise ValueError("pmt_data needs one entry per oscilloscope")
+            if hv is None:
+                raise ValueError("hv is needed to store data in pmt_data")
+        if isinstance(channels, str):
+            channels = [channels]
+        names = {channel: name if len(channels) == 1
+                 else "{}_{}".format(name, channel) for channel in channels}
+        barrier = None
+        if shared_trigger is not None:
+            self.map(lambda osci: osci.set_trigger_source(shared_trigger))
+            barrier = threading.Barrier(len(self.oscis))
+
+        def acquire(osci):
+            pmt = None
+            if pmt_data is not None:
+                pmt = pmt_data[self.oscis.index(osci)]
+            waveforms = {channel: 0 for channel in channels}
+            nbytes = [0]
+            store = self._storer(osci, pmt, hv, names)
+
+            def count(channel, loop, samples):
+                waveforms[channel] += len(samples)
+                nbytes[0] += samples.nbytes
+                if store is not None:
+                    store(channel, loop, samples)
+
+            osci.arm_barrier = barrier
+            start_time = time.time()
+            try:
+                sequences = osci.aquire_waveforms(channels,
+                                                  number_of_waveforms,
+                                                  pipelined=pipelined,
+                                                  callback=count, keep=keep)
+            except Exception:
+                if barrier is not None:
+                    barrier.abort()
+                raise
+            finally:
+                osci.arm_barrier = None
+            duration = time.time() - start_time
+            if pmt is not None:
+                self._store_calibration(osci, pmt, hv, names, waveforms)
+            waveforms = max(waveforms.values(), default=0)
+            return sequences, {
+                'waveforms': waveforms,
+                'bytes': nbytes[0],
+                'duration': duration,
+                'waveforms_per_s': waveforms / duration if duration else 0.,
+                'mb_per_s': nbytes[0] / 1e6 / duration if duration else 0.,
+            }
+
+        results = self.map(acquire)
+        self.acquisition_stats = {ip: stats for ip, (_, stats)
+                                  in zip(self.ips, results)}
+        return {ip: sequences for ip, (sequences, _)
+                in zip(self.ips, results)}
+
+    @staticmethod
+    def _storer(osci, pmt, hv, names):
+        # the callback may run in the background thread of a pipelined
+        # acquisition, so the calibration is queried before the run
+        if pmt is None:
+            return None
+        horizontal_interval = osci.get_horizontal_interval()
+        gains = {channel: osci.get_channel_gain(channel) for channel in names}
+
+        def store(channel, loop, samples):
+            if loop == 0:
+                pmt.add_waveforms(hv, names[channel], horizontal_interval,
+                                  gains[channel], samples)
+            else:
+                pmt.append_waveforms(hv, names[channel], samples)
+        return store
+
+    @staticmethod
+    def _store_calibration(osci, pmt, hv, names, waveforms):
+        # the sequence mode of the run can change the horizontal interval
+        horizontal_interval = osci.get_horizontal_interval()
+        for channel, dataset_name in names.items():
+            gain = osci.get_channel_gain(channel)
+            if not waveforms[channel]:
+                pmt.add_waveforms(hv, dataset_name, horizontal_interval, gain,
+                                  np.empty((0, 0), dtype=np.int8))
+                continue
+            groupname = "/raw_data/{0:.0f}V/{1}".format(hv, dataset_name)
+            pmt._set_attr(groupname, u'horizontal_interval',
+                          horizontal_interval)
+            pmt._set_attr(groupname, u'vertical_gain', gain)
@@ -1,22 +1,128 @@
 #!/usr/bin/env python
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import queue
+import threading
+import time
+
 import visa
 import numpy as np
 import h5py
 from tqdm import tqdm_notebook
 
-OPEN_CMD = "TCPIP0::{}::INSTR"
+from ducroy.transport import OPEN_CMD, VisaTransport, VicpTransport
+from ducroy.waveform_reader import WaveformDataset
+
+# Cached query answers which become invalid when a setting command is sent,
+# "{}" is replaced by the channel of the command. Setting commands which are
+# not listed here clear the whole cache.
+CACHE_INVALIDATES = {
+    'TRSE': ['TRSE?'],
+    'TRSL': ['{}:TRSL?'],
+    'TRLV': ['{}:TRLV?'],
+    'VDIV': ['{}:VDIV?', '{}:INSP?'],
+    'OFST': ['{}:INSP?'],
+    'TDIV': ['TDIV?', 'SEQ?', 'INSP?'],
+    'SEQ': ['SEQ?', 'INSP?'],
+    'WFSU': [],
+}
+# Commands which do not change any setting
+CACHE_IGNORES = {'ARM', 'WAIT', 'CLSW', 'TRMD', 'STOP', 'FRTR'}
+
+
+def decode_binary_block(raw, dtype=np.int8):
+    """Decode an IEEE 488.2 definite length block (e.g. the answer to WF?)
+    Parameters
+    ----------
+    raw: bytes-like object containing the block, leading command headers
+    and a trailing terminator are ignored
+    dtype: data type of the block
+    Returns
+    -------
+    data: numpy array viewing the data inside raw without copying
+    """
+    start = bytes(raw[:64]).find(b'#')
+    if start < 0:
+        raise ValueError("No binary block found")
+    digits = int(chr(raw[start + 1]))
+    length = int(bytes(raw[start + 2:start + 2 + digits]))
+    offset = start + 2 + digits
+    if len(raw) < offset + length:
+        raise ValueError("Binary block is incomplete")
+    dtype = np.dtype(dtype)
+    return np.frombuffer(raw, dtype, length // dtype.itemsize, offset)
+
+
+def _mnemonics(command):
+    # mnemonics of the setting commands in a message (without channels)
+    retval = []
+    for single_command in command.split(';'):
+        header = single_command.strip().split(' ', 1)[0]
+        if header and not header.endswith('?'):
+            retval.append(header.rpartition(':')[2])
+    return retval
+
+
+class _MissingAnswer(Exception):
+    pass
+
+
+class CommandBatch(object):
+    """Commands collected by Osci.batch
+    Attributes
+    ----------
+    commands: setting commands waiting to be sent
+    results: return values of the setters called inside the batch, in call
+    order, available after the batch has been sent
+    """
+
+    def __init__(self):
+        self.commands = []
+        self.results = []
+        self.readbacks = []
+        self.answers = dict()
+        self.missing = []
+        self.resolving = False
 
 
 class Osci(object):
 
-    def __init__(self, ip):
+    def __init__(self, ip, cache=False, transport='visa'):
+        """
+        Parameters
+        ----------
+        ip: IP address of the oscilloscope
+        cache (bool): remember the answers of setting queries and answer
+        them locally until a command which changes the setting is sent
+        transport: 'visa' (pyvisa-py, VXI-11), 'vicp' (raw socket, LeCroy
+        VICP) or a transport object from ducroy.transport
+        """
+        if isinstance(transport, str) and transport not in ('visa', 'vicp'):
+            raise ValueError("Unknown transport {}".format(transport))
         self.ip = ip
-        self.rm = visa.ResourceManager('@py')
+        self.transport = transport
+        self.rm = None
+        if transport == 'visa':
+            self.rm = visa.ResourceManager('@py')
         self.visa_if = None
+        self.cache = dict() if cache else None
+        self._batch = None
+        self._segments = None
+        self._transfer_segment = 0
+        self.acquisition_stats = None
+        self.arm_barrier = None
 
     def _open_resource(self):
-        self.visa_if = self.rm.open_resource(OPEN_CMD.format(self.ip))
+        if self.transport == 'visa':
+            self.visa_if = VisaTransport(self.ip, self.rm)
+        elif self.transport == 'vicp':
+            self.visa_if = VicpTransport(self.ip)
+            self.visa_if.open()
+        else:
+            if hasattr(self.transport, 'open'):
+                self.transport.open()
+            self.visa_if = self.transport
 
     def write(self, command, channel=None, value=None, unit=None):
         if channel is not None:
@@ -25,6 +131,14 @@ class Osci(object):
             command = command + " " + value
         if unit is not None:
             command = command + unit
+        if self.cache is not None:
+            self._update_cache(command)
+        if 'SEQ' in _mnemonics(command):
+            # the number of segments is read again before the next transfer
+            self._segments = None
+        if self._batch is not None:
+            self._batch.commands.append(command)
+            return
         try:
             self.visa_if.write(command)
         except:
@@ -35,11 +149,126 @@ class Osci(object):
             command = channel + ":" + command
         command = command + "?"
         try:
-            return self.visa_if.query(command)
+            return self._query(command)
+        except _MissingAnswer:
+            raise
         except:
             print("Couldn't read command!")
             return None
 
+    def clear_cache(self):
+        if self.cache is not None:
+            self.cache.clear()
+
+    @contextmanager
+    def batch(self):
+        """Collects all setting commands sent inside the with block and sends
+        them as one message at the end of the block. The read-backs of the
+        setters are resolved afterwards with combined queries, inside the
+        block the setters return None and their results are available in
+        the results of the returned CommandBatch. Queries needed inside the
+        block are sent together with the commands collected so far. Waveform
+        transfers are not batched.
+        Example
+        -------
+        with osci.batch() as batch:
+            osci.set_timebase(1e-8)
+            osci.set_channel_vdiv(0.1, 'C1')
+        timebase, gain = batch.results
+        """
+        if self._batch is not None:
+            yield self._batch
+            return
+        batch = CommandBatch()
+        self._batch = batch
+        try:
+            yield batch
+        finally:
+            self._batch = None
+        self._send_batch(batch)
+
+    def _send_batch(self, batch):
+        if batch.commands:
+            self.visa_if.write(";".join(batch.commands))
+            batch.commands = []
+        pending = list(enumerate(batch.readbacks))
+        batch.results = [None] * len(pending)
+        batch.resolving = True
+        self._batch = batch
+        try:
+            while pending:
+                batch.missing = []
+                unresolved = []
+                for index, (function, args) in pending:
+                    try:
+                        batch.results[index] = function(*args)
+                    except _MissingAnswer:
+                        unresolved.append((index, (function, args)))
+                queries = list(dict.fromkeys(batch.missing))
+                if queries:
+                    answers = self.visa_if.query(";".join(queries))
+                    answers = answers.strip().split(';')
+                    if len(answers) != len(queries):
+                        raise ValueError("Unexpected answer to batch query")
+                    batch.answers.update(zip(queries, answers))
+                    if self.cache is not None:
+                        self.cache.update(zip(queries, answers))
+                pending = unresolved
+        finally:
+            batch.resolving = False
+            self._batch = None
+
+    def _readback(self, function, *args):
+        if self._batch is not None and not self._batch.resolving:
+            self._batch.readbacks.append((function, args))
+            return None
+        return function(*args)
+
+    def _query(self, command):
+        if self.cache is not None and command in self.cache:
+            return self.cache[command]
+        if self._batch is None:
+            readback = self.visa_if.query(command)
+        elif command in self._batch.answers:
+            return self._batch.answers[command]
+        elif self._batch.resolving:
+            self._batch.missing.append(command)
+            raise _MissingAnswer(command)
+        else:
+            readback = self.visa_if.query(
+                ";".join(self._batch.commands + [command]))
+            self._batch.commands = []
+        if self.cache is not None:
+            self.cache[command] = readback
+        return readback
+
+    def _query_measurement(self, command):
+        # measurements change with every sweep, so they are never cached,
+        # inside a batch they are sent with the commands collected so far
+        if self._batch is not None and self._batch.commands:
+            command = ";".join(self._batch.commands + [command])
+            self._batch.commands = []
+        return self.visa_if.query(command)
+
+    def _update_cache(self, command):
+        for single_command in command.split(';'):
+            header = single_command.strip().split(' ', 1)[0]
+            if header == "" or header.endswith('?'):
+                continue
+            channel, _, mnemonic = header.rpartition(':')
+            if mnemonic in CACHE_IGNORES:
+                continue
+            if mnemonic not in CACHE_INVALIDATES:
+                self.cache.clear()
+                continue
+            for prefix in CACHE_INVALIDATES[mnemonic]:
+                prefix = prefix.format(channel)
+                for key in [k for k in self.cache if k.startswith(prefix)]:
+                    del self.cache[key]
+            if mnemonic == 'TRSE':
+                # the readback has the same format as the command
+                self.cache['TRSE?'] = single_command.strip()
+
     @staticmethod
     def save_waveforms_to_file(filepath, data_array, hor_interval, vert_gain, comment=None):
         with h5py.File(filepath, "w") as file:
@@ -58,6 +287,22 @@ class Osci(object):
             retval['data'] = np.asarray(file['waveforms'])
         return retval
 
+    @staticmethod
+    def open_waveforms_file(filepath, channel=None):
+        """Lazy access to the waveforms of save_waveforms_to_file or
+        stream_waveforms_to_file without loading them
+        Parameters
+        ----------
+        filepath: path of the HDF5 file
+        channel: channel of a file with several channels
+        Returns
+        -------
+        waveforms: ducroy.waveform_reader.WaveformDataset, supports slicing
+        and iter_chunks
+        """
+        name = 'waveforms' if channel is None else 'waveforms_' + channel
+        return WaveformDataset(filepath, name)
+
     def set_sequence_mode(self, sequences):
         command = "SEQ"
         argument = ""
@@ -67,19 +312,20 @@ class Osci(object):
             argument = "ON," + str(sequences)
         self.write(command,value=argument)
 
-        return self.get_number_of_sequences()
+        return self._readback(self.get_number_of_sequences)
 
     def get_number_of_sequences(self):
         sequence_info = self._read_sequence_info()
         if sequence_info[0] == 'OFF':
+            self._segments = 1
             return None
         else:
-            return int(sequence_info[1])
+            self._segments = int(sequence_info[1])
+            return self._segments
 
     def get_number_of_sweeps(self):
         command = "PAST? CUST, SWEEPS"
-        self.write(command)
-        readback = self.visa_if.read_raw().decode('ascii')
+        readback = self._query_measurement(command)
         readback = readback.replace("PAST CUST,SWEEPS,", "")
         readback = readback.strip().split(',')
         retval = []
@@ -95,8 +341,7 @@ class Osci(object):
 
     def get_measure(self, measure_channel):
         command = "PAST? CUST," + measure_channel
-        self.write(command)
-        readback = self.visa_if.read_raw().decode('ascii')
+        readback = self._query_measurement(command)
         readback = readback.replace("PAST CUST,"+measure_channel+",","")
         readback = readback.split(",")
         retval = dict(zip(readback[2::2],readback[3::2]))
@@ -110,22 +355,41 @@ class Osci(object):
                     retval[key] = float(value)
             else:
                 value = value.strip()
-		value = float(value)
+                value = float(value)
                 retval[key] = int(value)
 
         self.write("CLSW;")
         return retval
 
 
-    def aquire_waveforms(self, channels, number_of_waveforms):
+    def aquire_waveforms(self, channels, number_of_waveforms,
+                         pipelined=False, callback=None, keep=True,
+                         sample_window=None, sparsing=None,
+                         segment_range=None):
         """Aquire a certain amount of waveforms, without being limited to the sequence memory of the oscilloscope
         Parameters
         ----------
         channels (string): list of channels where the data to read from
         number_of_waveforms (int): the amount of waveforms to record
+        pipelined (bool): re-arm the oscilloscope directly after the transfer
+        and decode/store the data in a background thread during the next
+        acquisition
+        callback: optional function callback(channel, loop, sequences) which
+        is called with every readout after it has been stored, e.g. to write
+        it to disk (runs in the background thread if pipelined)
+        keep (bool): collect the waveforms in memory, if False they are only
+        passed to the callback and an empty dict is returned
+        sample_window (tuple): (first, stop) sample of every waveform which is
+        transferred, the scope cuts the waveforms before the transfer
+        sparsing (int): transfer only every n-th sample
+        segment_range (tuple): (first, last) segment number (starting at 1)
+        of every sequence which is transferred, each segment is transferred
+        separately, so this is meant for a few segments per sequence. A
+        ValueError is raised if the range is not inside the sequence
         Returns
         -------
         sequences: two dimensional array with the waveforms as ADC values
+        The timing of the run is stored in acquisition_stats.
         """
 
         if isinstance(channels, str):
@@ -142,37 +406,342 @@ class Osci(object):
 
         sequences = dict()
 
-        for channel in channels:
-            sequences[channel] = np.array([])
-
-        number_of_recording_loops = number_of_waveforms//number_of_sequences
+        waveforms_per_loop = number_of_sequences
+        segment_numbers = None
+        if segment_range is not None:
+            first, last = segment_range
+            if not 1 <= first <= last <= (number_of_sequences or 1):
+                raise ValueError(
+                    "segment_range {} is outside of the {} segments".format(
+                        segment_range, number_of_sequences or 1))
+            segment_numbers = list(range(first, last + 1))
+            waveforms_per_loop = len(segment_numbers)
+        number_of_recording_loops = number_of_waveforms//waveforms_per_loop
         if number_of_waveforms == 0:
+            for channel in channels:
+                sequences[channel] = np.empty((0, 0), dtype=np.int8)
             return sequences
         elif number_of_recording_loops == 0:
             number_of_recording_loops = 1
-        for i in tqdm_notebook(range(number_of_recording_loops)):
-            self.record_waveforms()
-            for channel in channels:
-                run_sequences = self.get_waveform_memory(channel)
-                sequences[channel] = np.reshape( np.append(sequences[channel],run_sequences) , (-1,run_sequences.shape[1]))
 
+        reduced = sample_window is not None or sparsing is not None or \
+            segment_numbers is not None
+        if reduced:
+            first_point, number_of_points = 0, 0
+            if sample_window is not None:
+                first_point = sample_window[0]
+                number_of_points = -(-(sample_window[1] - sample_window[0]) //
+                                     max(sparsing or 1, 1))
+            self.set_waveform_setup(sparsing or 0, number_of_points,
+                                    first_point)
+
+        stats = {'loops': number_of_recording_loops, 'host_time': 0.,
+                 'waiting_time': 0.}
+        start_time = time.time()
+        executor = ThreadPoolExecutor(max_workers=1) if pipelined else None
+        pending = None
+        try:
+            for i in tqdm_notebook(range(number_of_recording_loops)):
+                self.record_waveforms()
+                readouts = []
+                for channel in channels:
+                    if segment_numbers is not None:
+                        readouts.append((channel, [
+                            self._read_waveform_raw(channel, segment)
+                            for segment in segment_numbers], False))
+                        continue
+                    out = self._readout_rows(sequences, channel, i,
+                                             number_of_recording_loops) \
+                        if keep else None
+                    readouts.append((channel, self._read_waveform_raw(
+                        channel, out=out), out is not None))
+                if executor is None:
+                    self._store_readouts(sequences, i, readouts,
+                                         number_of_recording_loops, callback,
+                                         keep, stats)
+                    continue
+                if pending is not None:
+                    wait_start = time.time()
+                    pending.result()
+                    stats['waiting_time'] += time.time() - wait_start
+                pending = executor.submit(
+                    self._store_readouts, sequences, i, readouts,
+                    number_of_recording_loops, callback, keep, stats)
+            if pending is not None:
+                wait_start = time.time()
+                pending.result()
+                stats['waiting_time'] += time.time() - wait_start
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if reduced:
+                self.set_waveform_setup()
+
+        stats['duration'] = time.time() - start_time
+        if pipelined:
+            stats['saved_dead_time'] = stats['host_time'] - \
+                stats['waiting_time']
+        else:
+            stats['saved_dead_time'] = 0.
+        self.acquisition_stats = stats
         return sequences
 
+    def _readout_rows(self, sequences, channel, loop, loops):
+        # preallocated rows of a readout, so that block transports can
+        # receive it without a copy (allocated with the first readout)
+        if not self._reads_blocks() or channel not in sequences:
+            return None
+        n = len(sequences[channel]) // loops
+        return sequences[channel][loop*n:(loop+1)*n]
+
+    def _store_readouts(self, sequences, loop, readouts, loops, callback,
+                        keep, stats):
+        start_time = time.time()
+        for channel, raw, stored in readouts:
+            if stored:
+                # received directly into the rows of the sequences
+                if callback is not None:
+                    callback(channel, loop, raw)
+                continue
+            if not keep:
+                if callback is not None:
+                    callback(channel, loop, self._decode_readout(raw))
+                continue
+            if channel not in sequences:
+                run_sequences = self._decode_readout(raw)
+                sequences[channel] = np.empty(
+                    (loops * len(run_sequences), run_sequences.shape[1]),
+                    dtype=np.int8)
+            n = len(sequences[channel]) // loops
+            run_sequences = self._decode_readout(
+                raw, out=sequences[channel][loop*n:(loop+1)*n])
+            if callback is not None:
+                callback(channel, loop, run_sequences)
+        stats['host_time'] += time.time() - start_time
+
+    def stream_waveforms_to_file(self, filepath, channels,
+                                 number_of_waveforms, comment=None,
+                                 queue_size=1, compression=None):
+        """Aquire waveforms and append every sequence directly to resizable
+        HDF5 datasets, so the run is not limited by the memory. The datasets
+        are written by a background thread while the next sequence is
+        recorded, the acquisition waits if queue_size readouts are not yet
+        written, so a crash loses at most queue_size sequences (one with the
+        default).
+        The file layout is the one of save_waveforms_to_file, with one
+        dataset 'waveforms_<channel>' per channel if more than one channel
+        is recorded (each with its own vertical_gain attribute).
+        Parameters
+        ----------
+        filepath: path of the HDF5 file, which is overwritten
+        channels (string): list of channels where the data to read from
+        number_of_waveforms (int): the amount of waveforms to record
+        comment: optional comment stored in the file
+        queue_size (int): maximum number of readouts which are not yet
+        written, at least 1
+        compression: optional h5py compression filter, e.g. 'gzip'
+        Returns
+        -------
+        written: dict with the number of waveforms written per channel
+        """
+        if queue_size < 1:
+            raise ValueError("queue_size has to be at least 1")
+        if isinstance(channels, str):
+            channels = [channels]
+        names = {channel: 'waveforms' if len(channels) == 1
+                 else 'waveforms_' + channel for channel in channels}
+        gains = {channel: self.get_channel_gain(channel)
+                 for channel in channels}
+        written = {channel: 0 for channel in channels}
+        blocks = queue.Queue()
+        # released once a readout is on disk
+        unwritten = threading.BoundedSemaphore(queue_size)
+        errors = []
 
+        with h5py.File(filepath, "w") as file:
+            file.attrs[u'vertical_gain'] = gains[channels[0]]
+            file.attrs[u'horizontal_interval'] = \
+                self.get_horizontal_interval()
+            if comment is not None:
+                file.attrs[u'comment'] = comment
 
+            def writer():
+                while True:
+                    item = blocks.get()
+                    if item is None:
+                        return
+                    if errors:
+                        unwritten.release()
+                        continue
+                    channel, block = item
+                    try:
+                        if names[channel] not in file:
+                            dataset = file.create_dataset(
+                                names[channel], shape=(0, block.shape[1]),
+                                maxshape=(None, block.shape[1]),
+                                chunks=block.shape, dtype=np.int8,
+                                compression=compression)
+                            dataset.attrs[u'vertical_gain'] = gains[channel]
+                        dataset = file[names[channel]]
+                        n = written[channel]
+                        dataset.resize(n + len(block), axis=0)
+                        dataset[n:] = block
+                        file.flush()
+                        written[channel] = n + len(block)
+                    except Exception as error:
+                        errors.append(error)
+                    unwritten.release()
+
+            def enqueue(channel, loop, block):
+                unwritten.acquire()
+                if errors:
+                    unwritten.release()
+                    raise errors[0]
+                blocks.put((channel, block))
+
+            thread = threading.Thread(target=writer)
+            thread.start()
+            try:
+                self.aquire_waveforms(channels, number_of_waveforms,
+                                      callback=enqueue, keep=False)
+            finally:
+                blocks.put(None)
+                thread.join()
+        if errors:
+            raise errors[0]
+        return written
+
+    def aquire_features(self, channels, number_of_waveforms, reducer,
+                        raw_prescale=0, **kwargs):
+        """Aquire waveforms and keep only per-waveform features. Every
+        readout is reduced in a background thread while the next sequence
+        is recorded, the raw waveforms are dropped afterwards.
+        Parameters
+        ----------
+        channels (string): list of channels where the data to read from
+        number_of_waveforms (int): the amount of waveforms to record
+        reducer: callable mapping an int8 array (segments, samples) onto one
+        feature record per waveform, e.g. ducroy.features.FeatureExtractor.
+        It is called with an empty (0, 0) array if nothing was recorded, so
+        the features have the dtype of the reducer in any case
+        raw_prescale (int): additionally keep every n-th raw waveform for
+        quality checks, none if 0
+        kwargs: further arguments of aquire_waveforms, e.g. sample_window
+        Returns
+        -------
+        features: dict with the concatenated feature arrays per channel
+        raw: dict with the prescaled raw waveforms per channel (empty if
+        raw_prescale is 0)
+        """
+        if isinstance(channels, str):
+            channels = [channels]
+        features = {channel: [] for channel in channels}
+        raw = {channel: [] for channel in channels} if raw_prescale else {}
+        offsets = {channel: 0 for channel in channels}
+
+        def reduce(channel, loop, block):
+            features[channel].append(reducer(block))
+            if raw_prescale:
+                first = -offsets[channel] % raw_prescale
+                raw[channel].append(block[first::raw_prescale].copy())
+                offsets[channel] += len(block)
+
+        self.aquire_waveforms(channels, number_of_waveforms, pipelined=True,
+                              callback=reduce, keep=False, **kwargs)
+        if not all(features.values()):
+            empty = reducer(np.empty((0, 0), dtype=np.int8))
+        features = {channel: np.concatenate(blocks) if blocks else empty
+                    for channel, blocks in features.items()}
+        raw = {channel: np.concatenate(blocks) if blocks else
+               np.empty((0, 0), dtype=np.int8)
+               for channel, blocks in raw.items()}
+        return features, raw
 
     def record_waveforms(self):
+        """Arms the oscilloscope for the next acquisition. If arm_barrier
+        (a threading.Barrier) is set, all oscilloscopes sharing it are armed
+        together."""
         command = "ARM; WAIT;"
+        if self.arm_barrier is not None:
+            self.arm_barrier.wait()
         self.write(command)
 
-    def get_waveform_memory(self, channel):
+    def get_waveform_memory(self, channel, out=None):
+        """Reads the waveforms of the last acquisition of a channel
+        Parameters
+        ----------
+        channel (string): channel to read from
+        out: optional int8 array of shape (sequences, samples) where the
+        waveforms are written to
+        Returns
+        -------
+        sequences: two dimensional array with the waveforms as ADC values,
+        if out is not given this is a read-only view of the received data
+        """
+        if out is not None and self._reads_blocks():
+            return self._read_waveform_raw(channel, out=out)
+        return self._decode_waveforms(self._read_waveform_raw(channel), out)
+
+    def _reads_blocks(self):
+        # transports which can receive binary blocks into numpy arrays
+        return hasattr(type(self.visa_if), 'read_block')
+
+    def _write_waveform_query(self, channel):
         command = channel + ":WF? DAT1"
-        sequences = self.get_number_of_sequences()
-        readback = self.visa_if.query_binary_values(command, datatype='b')
-        samples = int(len(readback)/sequences)
-        retval = np.reshape(readback, (sequences,samples))
-        retval = retval.astype(np.int8)
-        return retval
+        if self._segments is None:
+            self.get_number_of_sequences()
+        self.visa_if.write(command)
+
+    def set_waveform_setup(self, sparsing=0, number_of_points=0,
+                           first_point=0, segment=0):
+        """Selects the part of the waveforms which is transferred by
+        get_waveform_memory (WFSU). The default values transfer everything.
+        Parameters
+        ----------
+        sparsing (int): transfer every n-th sample, 0 for all samples
+        number_of_points (int): samples per waveform, 0 for all samples
+        first_point (int): first sample of every waveform
+        segment (int): single segment to transfer, 0 for all segments
+        """
+        self._transfer_segment = segment
+        self.write("WFSU", value="SP,{},NP,{},FP,{},SN,{}".format(
+            sparsing, number_of_points, first_point, segment))
+
+    def _read_waveform_raw(self, channel, segment=None, out=None):
+        if segment is not None:
+            self.write("WFSU", value="SN,{}".format(segment))
+        self._write_waveform_query(channel)
+        if self._reads_blocks():
+            return self.visa_if.read_block(np.int8, out=out)
+        return self.visa_if.read_raw()
+
+    def _decode_readout(self, raw, out=None):
+        if not isinstance(raw, list):
+            return self._decode_waveforms(raw, out)
+        retval = np.concatenate([self._decode_waveforms(r, segments=1)
+                                 for r in raw])
+        if out is None:
+            return retval
+        out[...] = retval
+        return out
+
+    def _decode_waveforms(self, raw, out=None, segments=None):
+        if isinstance(raw, np.ndarray):
+            readback = raw
+        else:
+            readback = decode_binary_block(raw)
+        if segments is None:
+            segments = 1 if self._transfer_segment else self._segments
+        if len(readback) % segments:
+            raise ValueError("{} samples can not be split into {} "
+                             "segments".format(len(readback), segments))
+        samples = len(readback) // segments
+        retval = readback[:segments * samples]
+        retval = retval.reshape(segments, samples)
+        if out is None:
+            return retval
+        out[...] = retval
+        return out
 
     def get_samples_per_wf(self):
         sequence_info = self._read_sequence_info()
@@ -189,7 +758,7 @@ class Osci(object):
         command = "VDIV"
         voltage_string = self.decimal_to_visa_string(voltage)
         self.write(command, channel, voltage_string, "V")
-        retval = self.get_channel_gain(channel)
+        retval = self._readback(self.get_channel_gain, channel)
         return retval
 
     def get_channel_vdiv(self, channel):
@@ -201,7 +770,7 @@ class Osci(object):
 
     def get_channel_gain(self, channel):
         command = channel + ":INSP? \"VERTICAL_GAIN\""
-        readback = self.visa_if.query(command)
+        readback = self._query(command)
         readback = readback.replace("\"","")
         readback = readback.replace(channel+":INSP","")
         readback = readback.replace(":","")
@@ -220,7 +789,7 @@ class Osci(object):
         command = "TDIV"
         timebase_string = self.decimal_to_visa_string(timebase)
         self.write(command, value=timebase_string)
-        return self.get_timebase()
+        return self._readback(self.get_timebase)
 
 
     def get_timebase(self):
@@ -243,7 +812,7 @@ class Osci(object):
         timebase: timebase float [seconds/div]
         """
         command = "INSP? \"HORIZ_INTERVAL\""
-        readback = self.visa_if.query(command)
+        readback = self._query(command)
         readback = readback.split('"')[1]
         readback = readback.replace("HORIZ_INTERVAL","")
         readback = readback.replace(":","")
@@ -274,7 +843,7 @@ class Osci(object):
             current_settings = self._read_trigger_select()
             channel = current_settings['SR']
         self.write(command, channel, slope)
-        retval = self.get_trigger_slope()
+        retval = self._readback(self.get_trigger_slope)
         return retval
 
     def get_trigger_slope(self, channel=None):
@@ -300,8 +869,7 @@ class Osci(object):
         current_settings = self._read_trigger_select()
         current_settings['SR'] = channel
         self._write_trigger_select(current_settings)
-        current_settings = self._read_trigger_select()
-        return current_settings['SR']
+        return self._readback(self.get_trigger_source)
 
     def get_trigger_source(self):
         """Returns the trigger source
@@ -324,7 +892,7 @@ class Osci(object):
             current_settings = self._read_trigger_select()
             channel = current_settings['SR']
         self.write(command, channel, level_string)
-        readback = self.get_trigger_level()
+        readback = self._readback(self.get_trigger_level)
         return readback
 
     def get_trigger_level(self, channel=None):
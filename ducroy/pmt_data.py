@@ -1,8 +1,17 @@
+from contextlib import contextmanager
+
 import h5py
 import numpy as np
 
+from ducroy.waveform_reader import WaveformDataset
+
+CHUNK_BYTES = 2**20
+
 class PmtData:
     def __init__(self, serial, nominal_voltage=1000, nominal_gain=3e6):
+        self._file = None
+        self._attrs = dict()
+        self._pending = dict()
         if serial == "":
             return
         self.filepath = "./{}.h5".format(serial)
@@ -16,54 +25,98 @@ class PmtData:
             grp_analysis.attrs[u'measured_nominal_voltage'] =  -1
             grp_analysis.attrs[u'measured_nominal_voltage_err'] = -1
 
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self, mode="r+"):
+        """Keeps the file open until close. Attribute reads are cached and
+        attribute writes are buffered until flush or close."""
+        if self._file is None:
+            self._file = h5py.File(self.filepath, mode)
+        return self
+
+    def flush(self):
+        if self._file is None:
+            return
+        for (groupname, key), value in self._pending.items():
+            self._file[groupname].attrs[key] = value
+        self._pending.clear()
+        self._file.flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self._file.close()
+            self._file = None
+            self._attrs.clear()
+
+    @contextmanager
+    def _open_file(self, mode):
+        if self._file is not None:
+            yield self._file
+        else:
+            with h5py.File(self.filepath, mode) as file:
+                yield file
+
+    def _read_attr(self, file, groupname, key):
+        if self._file is None:
+            return file[groupname].attrs[key]
+        if (groupname, key) not in self._attrs:
+            self._attrs[(groupname, key)] = file[groupname].attrs[key]
+        return self._attrs[(groupname, key)]
+
+    def _write_attr(self, file, groupname, key, value):
+        if self._file is None:
+            file[groupname].attrs[key] = value
+        else:
+            self._attrs[(groupname, key)] = value
+            self._pending[(groupname, key)] = value
+
+    def _get_attr(self, groupname, key):
+        with self._open_file("r") as file:
+            return self._read_attr(file, groupname, key)
+
+    def _set_attr(self, groupname, key, value):
+        with self._open_file("r+") as file:
+            self._write_attr(file, groupname, key, value)
+
     @property
     def serial(self):
-        retval = ''
-        with h5py.File(self.filepath, "r") as file:
-            retval = str(file.attrs[u'serial'])
-        return retval
+        return str(self._get_attr(u'/', u'serial'))
 
     @serial.setter
     def serial(self, value):
-        with h5py.File(self.filepath, "r+") as file:
-            file.attrs[u'serial'] = value
+        self._set_attr(u'/', u'serial', value)
 
     @property
     def nominal_voltage(self):
-        retval = ''
-        with h5py.File(self.filepath, "r") as file:
-            retval = file.attrs[u'nominal_voltage']
-        return retval
+        return self._get_attr(u'/', u'nominal_voltage')
 
     @nominal_voltage.setter
     def nominal_voltage(self, value):
-        with h5py.File(self.filepath, "r+") as file:
-            file.attrs[u'nominal_voltage'] = value
+        self._set_attr(u'/', u'nominal_voltage', value)
 
     @property
     def nominal_gain(self):
-        retval = ''
-        with h5py.File(self.filepath, "r") as file:
-            retval = file.attrs[u'nominal_gain']
-        return retval
+        return self._get_attr(u'/', u'nominal_gain')
 
     @nominal_gain.setter
     def nominal_gain(self, value):
-        with h5py.File(self.filepath, "r+") as file:
-            file.attrs[u'nominal_gain'] = value
+        self._set_attr(u'/', u'nominal_gain', value)
 
 
     def _get_analysis_attr(self, key):
-        retval = None
-        with h5py.File(self.filepath, "r") as file:
-            group = file[u'analysis']
-            retval = group.attrs[key]
-        return retval
+        return self._get_attr(u'/analysis', key)
 
     def _set_analysis_attr(self, key, value):
-        with h5py.File(self.filepath, "r+") as file:
-            group = file[u'analysis']
-            group.attrs[key] = value
+        self._set_attr(u'/analysis', key, value)
 
     @property
     def measured_nominal_voltage(self):
@@ -99,74 +152,133 @@ class PmtData:
 
     def add_fit_results(self, hv, used_gaussians, nphe, q0, q0sigma, q1, q1sigma, gain, gain_err):
         dataset_groupname = "/analysis/{:.0f}V".format(hv)
-        with h5py.File(self.filepath, "r+") as file:
-            dataset_group = None
+        with self._open_file("r+") as file:
             if dataset_groupname not in file.keys():
-                dataset_group = file.create_group(dataset_groupname)
-            else:
-                dataset_group = file[dataset_groupname]
-            dataset_group.attrs[u'nphe'] = nphe
-            dataset_group.attrs[u'used_gaussians'] = used_gaussians
-            dataset_group.attrs[u'q0'] = q0
-            dataset_group.attrs[u'q0sigma'] = q0sigma
-            dataset_group.attrs[u'q1'] = q1
-            dataset_group.attrs[u'q1sigma'] = q1sigma
-            dataset_group.attrs[u'gain'] = gain
-            dataset_group.attrs[u'gain_err'] = gain_err
+                file.create_group(dataset_groupname)
+            self._write_attr(file, dataset_groupname, u'nphe', nphe)
+            self._write_attr(file, dataset_groupname, u'used_gaussians', used_gaussians)
+            self._write_attr(file, dataset_groupname, u'q0', q0)
+            self._write_attr(file, dataset_groupname, u'q0sigma', q0sigma)
+            self._write_attr(file, dataset_groupname, u'q1', q1)
+            self._write_attr(file, dataset_groupname, u'q1sigma', q1sigma)
+            self._write_attr(file, dataset_groupname, u'gain', gain)
+            self._write_attr(file, dataset_groupname, u'gain_err', gain_err)
 
     def get_fit_results(self, hv):
         retval = dict()
         dataset_groupname = "/analysis/{:.0f}V".format(hv)
-        with h5py.File(self.filepath, "r") as file:
-            dataset_group = file[dataset_groupname]
-            retval[u'nphe'] = file[dataset_groupname].attrs[u'nphe']
-            retval[u'used_gaussians'] = file[dataset_groupname].attrs[u'used_gaussians']
-            retval[u'q0'] = file[dataset_groupname].attrs[u'q0']
-            retval[u'q0sigma'] = file[dataset_groupname].attrs[u'q0sigma']
-            retval[u'q1'] = file[dataset_groupname].attrs[u'q1']
-            retval[u'q1sigma'] = file[dataset_groupname].attrs[u'q1sigma']
-            retval[u'gain'] = file[dataset_groupname].attrs[u'gain']
-            retval[u'gain_err'] = file[dataset_groupname].attrs[u'gain_err']
+        with self._open_file("r") as file:
+            for key in (u'nphe', u'used_gaussians', u'q0', u'q0sigma', u'q1',
+                        u'q1sigma', u'gain', u'gain_err'):
+                retval[key] = self._read_attr(file, dataset_groupname, key)
         return retval
 
-    def add_waveforms(self, hv, name, horizontal_interval, vertical_gain, samples, comment=''):
+    def add_waveforms(self, hv, name, horizontal_interval, vertical_gain, samples, comment='',
+                      compression='gzip', compression_opts=4, shuffle=False, chunk_segments=None,
+                      overwrite=False):
+        """Stores the waveforms (segments, samples) in a chunked dataset which
+        is resizable along the waveform axis, see append_waveforms. Existing
+        waveforms of the same name raise a ValueError unless overwrite is set,
+        in which case they are replaced. The compression is any h5py
+        filter, e.g. 'gzip' (with the level as compression_opts), 'lzf' or
+        None. The shuffle filter only helps for samples wider than int8.
+        Waveforms without samples, e.g. of an acquisition of 0 waveforms, are
+        stored in a plain dataset which can not be appended to."""
+        samples = np.asarray(samples)
         dataset_groupname = "/raw_data/{0:.0f}V/{1}".format(hv, name)
-        with h5py.File(self.filepath, "r+") as file:
+        if chunk_segments is None:
+            row_bytes = max(samples[0].nbytes if len(samples) else 1, 1)
+            chunk_segments = max(min(len(samples), CHUNK_BYTES // row_bytes), 1)
+        with self._open_file("r+") as file:
             if dataset_groupname not in file.keys():
                 dataset_group = file.create_group(dataset_groupname)
             else:
                 dataset_group = file[dataset_groupname]
-            dataset_group.attrs[u'comment'] = comment
-            dataset_group.attrs[u'horizontal_interval'] = horizontal_interval
-            dataset_group.attrs[u'vertical_gain'] = vertical_gain
-            dataset_group[u'data'] = samples
+            if u'data' in dataset_group and not overwrite:
+                raise ValueError("{}/data already exists, use append_waveforms or "
+                                 "overwrite=True".format(dataset_groupname))
+            self._write_attr(file, dataset_groupname, u'comment', comment)
+            self._write_attr(file, dataset_groupname, u'horizontal_interval', horizontal_interval)
+            self._write_attr(file, dataset_groupname, u'vertical_gain', vertical_gain)
+            if u'data' in dataset_group:
+                del dataset_group[u'data']
+            if 0 in samples.shape[1:]:
+                # h5py can not chunk empty waveforms, they are stored as they are
+                dataset_group[u'data'] = samples
+                return
+            dataset_group.create_dataset(
+                u'data', data=samples, maxshape=(None,) + samples.shape[1:],
+                chunks=(chunk_segments,) + samples.shape[1:], compression=compression,
+                compression_opts=compression_opts if compression == 'gzip' else None,
+                shuffle=shuffle)
+
+    def append_waveforms(self, hv, name, samples):
+        """Appends waveforms to the data set of add_waveforms and returns the
+        new number of waveforms"""
+        samples = np.asarray(samples)
+        dataset_name = "/raw_data/{0:.0f}V/{1}/data".format(hv, name)
+        with self._open_file("r+") as file:
+            dataset = file[dataset_name]
+            if dataset.maxshape[0] is not None:
+                raise ValueError("{} is not resizable".format(dataset_name))
+            if dataset.shape[1:] != samples.shape[1:]:
+                raise ValueError("Waveforms have {} samples, {} expected".format(
+                    samples.shape[1:], dataset.shape[1:]))
+            n = len(dataset)
+            dataset.resize(n + len(samples), axis=0)
+            dataset[n:] = samples
+            return len(dataset)
+
+    def get_waveforms(self, hv, name):
+        """Lazy proxy of the raw waveforms, see WaveformDataset. In a session
+        the proxy uses the open file handle."""
+        dataset_name = "/raw_data/{0:.0f}V/{1}/data".format(hv, name)
+        if self._file is not None:
+            # the proxy reads the attributes from the file
+            self.flush()
+            return WaveformDataset(self._file, dataset_name)
+        return WaveformDataset(self.filepath, dataset_name)
 
     def add_histogram(self, hv, x, y):
         dataset_groupname = "/analysis/{:.0f}V".format(hv)
-        with h5py.File(self.filepath, "r+") as file:
+        with self._open_file("r+") as file:
             dataset_group = None
             if dataset_groupname not in file.keys():
                 dataset_group = file.create_group(dataset_groupname)
             else:
                 dataset_group = file[dataset_groupname]
+            if u'histogram' in dataset_group:
+                del dataset_group[u'histogram']
             dataset_group[u'histogram'] = (x, y)
 
     def get_histogram(self, hv):
         retval = None
         dataset_groupname = "/analysis/{:.0f}V/histogram".format(hv)
-        with h5py.File(self.filepath, "r") as file:
+        with self._open_file("r") as file:
             retval = np.asarray(file[dataset_groupname])
         return retval
 
+    def get_histogram_voltages(self):
+        hv = []
+        with self._open_file("r") as file:
+            analysis = file[u'analysis']
+            for key in list(analysis.keys()):
+                if u'histogram' in analysis[key]:
+                    hv.append(int(key.rstrip('V')))
+        return hv
+
     def get_gains_and_voltages(self):
         hv = []
         gain = []
-        with h5py.File(self.filepath, "r") as file:
+        with self._open_file("r") as file:
             analysis = file[u'analysis']
             for key in list(analysis.keys()):
-                voltage = int(key.rstrip('V'))
-                hv.append(voltage)
-                gain.append(self.get_fit_results(voltage)['gain'])
+                groupname = u'/analysis/' + key
+                if (groupname, u'gain') not in self._attrs and \
+                        u'gain' not in analysis[key].attrs:
+                    continue
+                hv.append(int(key.rstrip('V')))
+                gain.append(self._read_attr(file, groupname, u'gain'))
         return (hv,gain)
 
 
@@ -0,0 +1,294 @@
+"""
+Vectorized processing of int8 waveform blocks.
+
+All functions take blocks of shape (segments, samples) as returned by
+``read_timetrace``, ``Osci.get_waveform_memory`` or stored in the raw_data of
+``PmtData``. NumPy arrays, memmaps and h5py datasets are processed in chunks
+of ``chunk_size`` waveforms, so the memory stays bounded, and all
+intermediate results are int32 or float32.
+
+The conversion to volts follows the LeCroy convention
+``volts = vertical_gain * adc - vertical_offset``.
+
+"""
+import numpy as np
+
+CHUNK_SIZE = 2**16
+PULSE_DTYPE = np.dtype([
+    ('pedestal', np.float32),
+    ('charge', np.float32),
+    ('amplitude', np.float32),
+    ('peak_sample', np.int32),
+])
+PROCESSED_DTYPE = np.dtype([
+    ('baseline', np.float32),
+    ('charge', np.float32),
+    ('amplitude', np.float32),
+    ('peak_time', np.float32),
+])
+
+
+def _chunks(waveforms, chunk_size):
+    for start in range(0, len(waveforms), chunk_size):
+        yield start, np.asarray(waveforms[start:start + chunk_size])
+
+
+def _pedestal(block, baseline_window, zero_level):
+    """Baseline in ADC counts, zero_level without a window"""
+    if baseline_window is None:
+        return np.full(len(block), zero_level, dtype=np.float32)
+    return block[:, slice(*baseline_window)].mean(axis=1, dtype=np.float32)
+
+
+def _sample_time(sample, horizontal_interval, horizontal_offset):
+    retval = sample.astype(np.float32)
+    retval *= np.float32(horizontal_interval)
+    retval += np.float32(horizontal_offset)
+    return retval
+
+
+def calibrate(waveforms, vertical_gain, vertical_offset=0., out=None,
+              chunk_size=CHUNK_SIZE):
+    '''
+    Convert ADC counts into volts
+
+    Parameters
+    ----------
+    waveforms : array_like, shape (segments, samples)
+    vertical_gain : float
+    vertical_offset : float, optional
+    out : ndarray, optional
+        float32 array of the same shape, e.g. a writable memmap
+    chunk_size : int, optional
+
+    Returns
+    -------
+    volts : ndarray of float32
+
+    '''
+    if out is None:
+        out = np.empty(np.shape(waveforms), dtype=np.float32)
+    gain = np.float32(vertical_gain)
+    offset = np.float32(vertical_offset)
+    for start, block in _chunks(waveforms, chunk_size):
+        chunk = out[start:start + len(block)]
+        np.multiply(block, gain, out=chunk, dtype=np.float32)
+        chunk -= offset
+    return out
+
+
+def baseline(waveforms, window, vertical_gain=1., vertical_offset=0.,
+             chunk_size=CHUNK_SIZE):
+    '''
+    Mean of every waveform in a window of samples
+
+    Parameters
+    ----------
+    waveforms : array_like, shape (segments, samples)
+    window : tuple of int
+        (start, stop) samples
+    vertical_gain, vertical_offset : float, optional
+        calibration, the default returns ADC counts
+    chunk_size : int, optional
+
+    Returns
+    -------
+    baseline : ndarray of float32, shape (segments,)
+
+    '''
+    retval = np.empty(len(waveforms), dtype=np.float32)
+    for start, block in _chunks(waveforms, chunk_size):
+        retval[start:start + len(block)] = _pedestal(block, window, 0.)
+    retval *= np.float32(vertical_gain)
+    retval -= np.float32(vertical_offset)
+    return retval
+
+
+def pulse_features(waveforms, baseline_window, window, polarity=-1,
+                   zero_level=0., chunk_size=CHUNK_SIZE):
+    '''
+    Pedestal, charge, amplitude and peak sample in ADC counts
+
+    This is the kernel of the calibrated functions of this module and of
+    ``ducroy.features.FeatureExtractor``.
+
+    Parameters
+    ----------
+    waveforms : array_like, shape (segments, samples)
+    baseline_window : tuple of int or None
+        (start, stop) samples of the pedestal, subtracted from every
+        waveform. Without a window the pedestal is zero_level.
+    window : tuple of int
+        (start, stop) samples of the pulse
+    polarity : int, optional
+        -1 for negative (PMT) pulses, 1 for positive pulses
+    zero_level : float, optional
+        pedestal in ADC counts if there is no baseline window
+    chunk_size : int, optional
+
+    Returns
+    -------
+    pulses : structured ndarray, shape (segments,)
+        pedestal [ADC counts], charge [ADC counts * samples] and amplitude
+        [ADC counts] relative to the pedestal, positive for pulses of the
+        given polarity, and the sample of the extremum
+
+    '''
+    if polarity not in (-1, 1):
+        raise ValueError("polarity has to be -1 or 1")
+    window = slice(*window)
+    sign = np.float32(polarity)
+    retval = np.empty(len(waveforms), dtype=PULSE_DTYPE)
+    for start, block in _chunks(waveforms, chunk_size):
+        pulses = retval[start:start + len(block)]
+        pedestal = _pedestal(block, baseline_window, zero_level)
+        signal = block[:, window]
+        charge = signal.sum(axis=1, dtype=np.int32).astype(np.float32)
+        charge -= pedestal * np.float32(signal.shape[1])
+        if polarity < 0:
+            sample = signal.argmin(axis=1)
+        else:
+            sample = signal.argmax(axis=1)
+        peak = signal[np.arange(len(signal)), sample]
+        pulses['pedestal'] = pedestal
+        pulses['charge'] = charge * sign
+        pulses['amplitude'] = (peak - pedestal) * sign
+        pulses['peak_sample'] = sample + window.indices(block.shape[1])[0]
+    return retval
+
+
+def integrate_charge(waveforms, window, vertical_gain, horizontal_interval,
+                     baseline_window=None, vertical_offset=0., impedance=50.,
+                     polarity=-1, chunk_size=CHUNK_SIZE):
+    '''
+    Charge of every waveform in a window of samples
+
+    Parameters
+    ----------
+    waveforms : array_like, shape (segments, samples)
+    window : tuple of int
+        (start, stop) samples of the integral
+    vertical_gain : float
+    horizontal_interval : float
+        sampling interval in seconds
+    baseline_window : tuple of int, optional
+        (start, stop) samples of the baseline, subtracted from every
+        waveform. Without a window the vertical offset defines 0 V.
+    vertical_offset : float, optional
+    impedance : float, optional
+        input impedance in Ohm
+    polarity : int, optional
+        -1 for negative (PMT) pulses, 1 for positive pulses
+    chunk_size : int, optional
+
+    Returns
+    -------
+    charge : ndarray of float32, shape (segments,)
+        charge in pC, positive for pulses of the given polarity
+
+    '''
+    pulses = pulse_features(waveforms, baseline_window, window, polarity,
+                            vertical_offset / vertical_gain, chunk_size)
+    return pulses['charge'] * np.float32(
+        vertical_gain * horizontal_interval / impedance * 1e12)
+
+
+def amplitude(waveforms, window, vertical_gain, baseline_window=None,
+              vertical_offset=0., polarity=-1, chunk_size=CHUNK_SIZE):
+    '''
+    Pulse height of every waveform in a window of samples
+
+    Parameters
+    ----------
+    waveforms : array_like, shape (segments, samples)
+    window : tuple of int
+        (start, stop) samples which are searched for the peak
+    vertical_gain : float
+    baseline_window : tuple of int, optional
+        (start, stop) samples of the baseline. Without a window the vertical
+        offset defines 0 V.
+    vertical_offset : float, optional
+    polarity : int, optional
+        -1 for negative (PMT) pulses, 1 for positive pulses
+    chunk_size : int, optional
+
+    Returns
+    -------
+    amplitude : ndarray of float32, shape (segments,)
+        amplitude in V, positive for pulses of the given polarity
+
+    '''
+    pulses = pulse_features(waveforms, baseline_window, window, polarity,
+                            vertical_offset / vertical_gain, chunk_size)
+    return pulses['amplitude'] * np.float32(vertical_gain)
+
+
+def peak_time(waveforms, window, horizontal_interval, horizontal_offset=0.,
+              polarity=-1, chunk_size=CHUNK_SIZE):
+    '''
+    Time of the extremum of every waveform in a window of samples
+
+    Parameters
+    ----------
+    waveforms : array_like, shape (segments, samples)
+    window : tuple of int
+        (start, stop) samples which are searched for the peak
+    horizontal_interval : float
+        sampling interval in seconds
+    horizontal_offset : float, optional
+        time of the first sample in seconds
+    polarity : int, optional
+        -1 for the minimum, 1 for the maximum
+    chunk_size : int, optional
+
+    Returns
+    -------
+    peak_time : ndarray of float32, shape (segments,)
+        time in seconds
+
+    '''
+    pulses = pulse_features(waveforms, None, window, polarity,
+                            chunk_size=chunk_size)
+    return _sample_time(pulses['peak_sample'], horizontal_interval,
+                        horizontal_offset)
+
+
+def process(waveforms, baseline_window, window, vertical_gain,
+            horizontal_interval, vertical_offset=0., horizontal_offset=0.,
+            impedance=50., polarity=-1, chunk_size=CHUNK_SIZE):
+    '''
+    Baseline, charge, amplitude and peak time in one pass over the data
+
+    Parameters
+    ----------
+    waveforms : array_like, shape (segments, samples)
+    baseline_window : tuple of int
+        (start, stop) samples of the baseline
+    window : tuple of int
+        (start, stop) samples of the pulse
+    vertical_gain : float
+    horizontal_interval : float
+    vertical_offset, horizontal_offset : float, optional
+    impedance : float, optional
+        input impedance in Ohm
+    polarity : int, optional
+        -1 for negative (PMT) pulses, 1 for positive pulses
+    chunk_size : int, optional
+
+    Returns
+    -------
+    results : structured ndarray, shape (segments,)
+        baseline [V], charge [pC], amplitude [V] and peak_time [s]
+
+    '''
+    pulses = pulse_features(waveforms, baseline_window, window, polarity,
+                            chunk_size=chunk_size)
+    retval = np.empty(len(pulses), dtype=PROCESSED_DTYPE)
+    retval['baseline'] = pulses['pedestal'] * np.float32(vertical_gain) - \
+        np.float32(vertical_offset)
+    retval['charge'] = pulses['charge'] * np.float32(
+        vertical_gain * horizontal_interval / impedance * 1e12)
+    retval['amplitude'] = pulses['amplitude'] * np.float32(vertical_gain)
+    retval['peak_time'] = _sample_time(pulses['peak_sample'],
+                                       horizontal_interval, horizontal_offset)
+    return retval
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+"""
+Simulated LeCroy Waverunner for offline tests and benchmarks.
+
+The simulator speaks VICP (see ``ducroy.transport.VicpTransport``) and
+understands the part of the remote command set used by ``Osci``: SEQ, TRSE,
+TRSL, TRLV, VDIV, TDIV, INSP?, PAST?, CLSW, ARM, WAIT, WFSU and WF? DAT1. The
+waveforms are synthetic PMT pulses with a Poisson distributed number of
+photoelectrons on top of Gaussian noise. Latency and bandwidth of the
+connection can be configured.
+
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+import numpy as np
+
+from ducroy.transport import VICP_HEADER, VICP_DATA, VICP_EOI, VICP_PORT
+
+ADC_COUNTS_PER_DIV = 25.
+HORIZONTAL_DIVS = 10.
+
+
+class SimulatedWaverunner(object):
+    """Simulated oscilloscope serving VICP on a local TCP port
+
+    Parameters
+    ----------
+    host : str, optional
+    port : int, optional
+        0 selects a free port, see ``port`` after ``start``
+    samples : int, optional
+        number of samples per waveform
+    latency : float, optional
+        delay before every answer in seconds
+    bandwidth : float, optional
+        transfer rate of the answers in bytes/s, unlimited if None
+    trigger_rate : float, optional
+        trigger rate in Hz, WAIT lasts segments / trigger_rate. Triggers
+        are immediate if None.
+    mean_pe : float, optional
+        mean number of photoelectrons per waveform
+    spe_amplitude : float, optional
+        mean single photoelectron amplitude in ADC counts
+    noise : float, optional
+        baseline noise in ADC counts
+    seed : int, optional
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, samples=1002, latency=0.,
+                 bandwidth=None, trigger_rate=None, mean_pe=1.,
+                 spe_amplitude=20., noise=1.5, seed=None):
+        self.host = host
+        self.port = port
+        self.samples = samples
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.trigger_rate = trigger_rate
+        self.mean_pe = mean_pe
+        self.spe_amplitude = spe_amplitude
+        self.noise = noise
+        self.rng = np.random.RandomState(seed)
+        self.settings = {
+            'SEQ': None,
+            'TDIV': 2e-8,
+            'TRSE': ['EDGE', 'SR', 'C1', 'HT', 'OFF'],
+            'VDIV': dict(),
+            'TRLV': dict(),
+            'TRSL': dict(),
+            'WFSU': {'SP': 0, 'NP': 0, 'FP': 0, 'SN': 0},
+        }
+        self.sweeps = 0
+        self.commands = 0
+        self._armed_at = None
+        self._waveforms = dict()
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        simulator = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                simulator._serve(self.request)
+
+        self._server = socketserver.ThreadingTCPServer((self.host, self.port),
+                                                       Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        args=(0.05,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def segments(self):
+        return self.settings['SEQ'] or 1
+
+    def _serve(self, connection):
+        stream = connection.makefile('rb')
+        message = b''
+        try:
+            while True:
+                header = stream.read(VICP_HEADER.size)
+                if len(header) < VICP_HEADER.size:
+                    return
+                operation, _, _, _, length = VICP_HEADER.unpack(header)
+                message += stream.read(length)
+                if not operation & VICP_EOI:
+                    continue
+                with self._lock:
+                    answer = self.execute(message.decode('ascii'))
+                message = b''
+                if answer is not None:
+                    self._send(connection, answer)
+        except OSError:
+            pass
+        finally:
+            stream.close()
+
+    def _send(self, connection, answer):
+        time.sleep(self.latency)
+        packet_size = 2**20
+        for start in range(0, len(answer), packet_size):
+            data = answer[start:start + packet_size]
+            eoi = VICP_EOI if start + packet_size >= len(answer) else 0
+            connection.sendall(VICP_HEADER.pack(VICP_DATA | eoi, 1, 1, 0,
+                                                len(data)) + data)
+            if self.bandwidth:
+                time.sleep(len(data) / self.bandwidth)
+
+    def execute(self, message):
+        """Executes a message with one or more ';' separated commands
+        Returns
+        -------
+        answer: bytes with the ';' joined answers of all queries or None
+        """
+        answers = []
+        for command in message.split(';'):
+            command = command.strip()
+            if command == "":
+                continue
+            self.commands += 1
+            answer = self._execute(command)
+            if answer is not None:
+                answers.append(answer)
+        if not answers:
+            return None
+        return b';'.join(answers) + b'\n'
+
+    def _execute(self, command):
+        header, _, argument = command.partition(' ')
+        channel, _, mnemonic = header.rpartition(':')
+        query = mnemonic.endswith('?')
+        mnemonic = mnemonic.rstrip('?')
+        argument = argument.strip()
+        if mnemonic == 'SEQ':
+            if query:
+                state = 'OFF' if self.settings['SEQ'] is None else 'ON'
+                return "SEQ {},{},{:.1E} S".format(
+                    state, self.segments, self.samples - 2).encode('ascii')
+            values = argument.split(',')
+            self.settings['SEQ'] = int(values[1]) if values[0] == 'ON' \
+                else None
+        elif mnemonic == 'TRSE':
+            if query:
+                return ("TRSE " + ",".join(self.settings['TRSE'])
+                        ).encode('ascii')
+            self.settings['TRSE'] = [v for v in argument.split(',') if v]
+        elif mnemonic in ('VDIV', 'TRLV', 'TRSL'):
+            defaults = {'VDIV': '1.00E-01', 'TRLV': '-1.00E-02',
+                        'TRSL': 'NEG'}
+            units = {'VDIV': 'V', 'TRLV': ' V', 'TRSL': ''}
+            if query:
+                value = self.settings[mnemonic].get(channel,
+                                                    defaults[mnemonic])
+                return "{}:{} {}{}".format(channel, mnemonic, value,
+                                           units[mnemonic]).encode('ascii')
+            self.settings[mnemonic][channel] = argument.rstrip('V ')
+        elif mnemonic == 'TDIV':
+            if query:
+                return "TDIV {:.2E} S".format(
+                    self.settings['TDIV']).encode('ascii')
+            self.settings['TDIV'] = float(argument.rstrip('S '))
+        elif mnemonic == 'INSP':
+            name = argument.strip('"')
+            if name == 'VERTICAL_GAIN':
+                value = self._vertical_gain(channel)
+            elif name == 'HORIZ_INTERVAL':
+                value = self._horizontal_interval()
+            else:
+                value = 0.
+            prefix = channel + ":" if channel else ""
+            return '{}INSP "{:<20}: {:.4E}"'.format(prefix, name,
+                                                    value).encode('ascii')
+        elif mnemonic == 'PAST':
+            return self._parameters(argument)
+        elif mnemonic == 'CLSW':
+            self.sweeps = 0
+        elif mnemonic == 'ARM':
+            self._armed_at = time.time()
+            self._waveforms.clear()
+            self.sweeps += self.segments
+        elif mnemonic == 'WAIT':
+            if self.trigger_rate and self._armed_at is not None:
+                remaining = self._armed_at + \
+                    self.segments / self.trigger_rate - time.time()
+                if remaining > 0:
+                    time.sleep(remaining)
+        elif mnemonic == 'WFSU':
+            if query:
+                return ("WFSU " + ",".join(
+                    "{},{}".format(key, self.settings['WFSU'][key])
+                    for key in ('SP', 'NP', 'FP', 'SN'))).encode('ascii')
+            values = argument.split(',')
+            for key, value in zip(values[::2], values[1::2]):
+                self.settings['WFSU'][key.strip()] = int(value)
+        elif mnemonic == 'WF':
+            data = self.transferred_waveforms(channel).tobytes()
+            return "{}:WF DAT1,#9{:09d}".format(
+                channel, len(data)).encode('ascii') + data
+        return None
+
+    def _vertical_gain(self, channel):
+        return float(self.settings['VDIV'].get(channel, 0.1)) / \
+            ADC_COUNTS_PER_DIV
+
+    def _horizontal_interval(self):
+        return self.settings['TDIV'] * HORIZONTAL_DIVS / self.samples
+
+    def _parameters(self, argument):
+        values = [v.strip() for v in argument.split(',')]
+        if values[1] == 'SWEEPS':
+            return ("PAST CUST,SWEEPS," + ",".join(
+                [str(self.sweeps)] + ['UNDEF'] * 7)).encode('ascii')
+        return "PAST CUST,{},AMPL,C1,AVG,{:.3E} V,SWEEPS,{}".format(
+            values[1], self.mean_pe * self.spe_amplitude *
+            self._vertical_gain('C1'), self.sweeps).encode('ascii')
+
+    def transferred_waveforms(self, channel):
+        """Part of the waveforms of a channel selected by WFSU: segment
+        number SN (all if 0), every SP-th sample (all if 0) starting at FP
+        and at most NP samples (all if 0)
+        """
+        setup = self.settings['WFSU']
+        waveforms = self.waveforms(channel)
+        if setup['SN']:
+            waveforms = waveforms[setup['SN'] - 1:setup['SN']]
+        waveforms = waveforms[:, setup['FP']::max(setup['SP'], 1)]
+        if setup['NP']:
+            waveforms = waveforms[:, :setup['NP']]
+        return np.ascontiguousarray(waveforms)
+
+    def waveforms(self, channel):
+        """Synthetic waveforms of the last acquisition of a channel
+        Returns
+        -------
+        waveforms: int8 array of shape (segments, samples)
+        """
+        if channel not in self._waveforms:
+            segments, samples = self.segments, self.samples
+            npe = self.rng.poisson(self.mean_pe, segments)
+            amplitude = self.spe_amplitude * (
+                npe + np.sqrt(npe) * 0.3 * self.rng.standard_normal(segments))
+            position = samples // 4
+            width = max(samples / 200., 1.)
+            shape = np.exp(-0.5 * ((np.arange(samples, dtype=np.float32) -
+                                    position) / width)**2)
+            data = self.noise * self.rng.standard_normal(
+                (segments, samples)).astype(np.float32)
+            data -= amplitude[:, None].astype(np.float32) * shape
+            self._waveforms[channel] = np.clip(np.round(data), -128,
+                                               127).astype(np.int8)
+        return self._waveforms[channel]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Simulated LeCroy Waverunner (VICP)")
+    parser.add_argument('-p', '--port', type=int, default=VICP_PORT)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('-s', '--samples', type=int, default=1002)
+    parser.add_argument('--latency', type=float, default=0.,
+                        help="answer latency [s]")
+    parser.add_argument('--bandwidth', type=float, default=None,
+                        help="transfer rate [bytes/s]")
+    parser.add_argument('--trigger-rate', type=float, default=None,
+                        help="trigger rate [Hz]")
+    args = parser.parse_args()
+
+    simulator = SimulatedWaverunner(args.host, args.port, args.samples,
+                                    args.latency, args.bandwidth,
+                                    args.trigger_rate)
+    simulator.start()
+    print("Simulated Waverunner listening on {}:{}".format(args.host,
+                                                           simulator.port))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
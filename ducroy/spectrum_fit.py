@@ -0,0 +1,245 @@
+"""
+Fit of PMT charge spectra.
+
+The model is the pedestal plus the N photoelectron Gaussians, weighted with
+the Poisson probabilities of the mean number of photoelectrons::
+
+    f(q) = A * sum_n P(n; nphe) * G(q; q0 + n * q1, sqrt(q0sigma**2 +
+                                                          n * q1sigma**2))
+
+The model and its Jacobian are evaluated for all Gaussians at once and the
+parameters are found with a Levenberg-Marquardt minimisation of the chi
+square, starting from initial guesses derived from the moments of the
+spectrum. The charges are expected in pC, as returned by
+``ducroy.processing.integrate_charge``.
+
+"""
+import numpy as np
+
+ELEMENTARY_CHARGE = 1.602176634e-19
+PARAMETERS = ('amplitude', 'nphe', 'q0', 'q0sigma', 'q1', 'q1sigma')
+MAX_GAUSSIANS = 50
+
+
+def _poisson_weights(nphe, n):
+    log_factorial = np.concatenate(([0.], np.cumsum(np.log(n[1:]))))
+    return np.exp(n * np.log(nphe) - nphe - log_factorial)
+
+
+def _model_and_jacobian(x, params, n_gaussians, jacobian=True):
+    amplitude, nphe, q0, q0sigma, q1, q1sigma = params
+    n = np.arange(n_gaussians + 1, dtype=np.float64)
+    weights = _poisson_weights(nphe, n)[:, None]
+    n = n[:, None]
+    mean = q0 + n * q1
+    sigma = np.sqrt(q0sigma**2 + n * q1sigma**2)
+    pull = (x - mean) / sigma
+    gauss = np.exp(-0.5 * pull**2) / (np.sqrt(2 * np.pi) * sigma)
+    weighted = weights * gauss
+    model = amplitude * weighted.sum(axis=0)
+    if not jacobian:
+        return model, None
+
+    d_mean = weighted * pull / sigma
+    d_sigma = weighted * (pull**2 - 1) / sigma
+    retval = np.empty((len(PARAMETERS), len(x)))
+    retval[0] = model / amplitude
+    retval[1] = amplitude * (weighted * (n / nphe - 1)).sum(axis=0)
+    retval[2] = amplitude * d_mean.sum(axis=0)
+    retval[3] = amplitude * (d_sigma * q0sigma / sigma).sum(axis=0)
+    retval[4] = amplitude * (d_mean * n).sum(axis=0)
+    retval[5] = amplitude * (d_sigma * n * q1sigma / sigma).sum(axis=0)
+    return model, retval
+
+
+def charge_spectrum(x, amplitude, nphe, q0, q0sigma, q1, q1sigma,
+                    n_gaussians):
+    '''
+    Model of the charge spectrum
+
+    Parameters
+    ----------
+    x : array_like
+        charges in pC
+    amplitude : float
+        number of entries times the bin width
+    nphe : float
+        mean number of photoelectrons
+    q0, q0sigma : float
+        position and width of the pedestal
+    q1, q1sigma : float
+        position and width of the single photoelectron peak relative to the
+        pedestal
+    n_gaussians : int
+        number of photoelectron Gaussians
+
+    Returns
+    -------
+    y : ndarray
+
+    '''
+    params = (amplitude, nphe, q0, q0sigma, q1, q1sigma)
+    return _model_and_jacobian(np.asarray(x, dtype=np.float64), params,
+                               n_gaussians, jacobian=False)[0]
+
+
+def initial_guess(x, y):
+    '''
+    Initial parameters from the moments of a spectrum with a dominant
+    pedestal peak
+
+    Returns
+    -------
+    params : ndarray
+        amplitude, nphe, q0, q0sigma, q1, q1sigma
+
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    bin_width = np.median(np.diff(x))
+    total = y.sum()
+    peak = np.argmax(y)
+    q0 = x[peak]
+
+    left = y[:peak]
+    if left.sum() > 0:
+        q0sigma = np.sqrt((left * (x[:peak] - q0)**2).sum() / left.sum())
+    else:
+        q0sigma = bin_width
+    pedestal = np.clip(2 * left.sum() + y[peak], 0.01 * total, 0.99 * total)
+    nphe = -np.log(pedestal / total)
+
+    mean = (x * y).sum() / total
+    variance = (y * (x - mean)**2).sum() / total
+    q1 = (mean - q0) / nphe
+    if q1 <= 0:
+        q1 = 5 * bin_width
+    q1sigma = np.sqrt(np.clip((variance - q0sigma**2) / nphe - q1**2,
+                              (0.1 * q1)**2, q1**2))
+    return np.array([total * bin_width, nphe, q0, max(q0sigma, bin_width / 2),
+                     q1, q1sigma])
+
+
+def fit_charge_spectrum(x, y, n_gaussians=None, p0=None, max_iterations=200,
+                        tolerance=1e-8):
+    '''
+    Fit the charge spectrum model to a histogram
+
+    Parameters
+    ----------
+    x : array_like
+        bin centres in pC
+    y : array_like
+        entries per bin
+    n_gaussians : int, optional
+        number of photoelectron Gaussians, by default enough to cover the
+        initial mean number of photoelectrons plus five standard deviations
+    p0 : array_like, optional
+        initial parameters (amplitude, nphe, q0, q0sigma, q1, q1sigma),
+        ``initial_guess`` by default
+    max_iterations : int, optional
+    tolerance : float, optional
+        relative change of the chi square which stops the minimisation
+
+    Returns
+    -------
+    results : dict
+        the values of ``PmtData.add_fit_results`` (used_gaussians, nphe, q0,
+        q0sigma, q1, q1sigma, gain, gain_err) plus the amplitude, the
+        parameter errors, chi2, ndf and the number of iterations
+
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    params = initial_guess(x, y) if p0 is None else \
+        np.array(p0, dtype=np.float64)
+    if n_gaussians is None:
+        n_gaussians = int(np.ceil(params[1] + 5 * np.sqrt(params[1]) + 2))
+        n_gaussians = min(n_gaussians, MAX_GAUSSIANS)
+    weights = 1. / np.sqrt(np.maximum(y, 1.))
+
+    def evaluate(params):
+        model, jacobian = _model_and_jacobian(x, params, n_gaussians)
+        residuals = (y - model) * weights
+        return residuals, jacobian * weights, (residuals**2).sum()
+
+    residuals, jacobian, chi2 = evaluate(params)
+    damping = 1e-3
+    iteration = 0
+    for iteration in range(1, max_iterations + 1):
+        alpha = jacobian.dot(jacobian.T)
+        beta = jacobian.dot(residuals)
+        converged = False
+        while damping < 1e10:
+            curvature = alpha + damping * np.diag(np.diag(alpha))
+            try:
+                step = np.linalg.solve(curvature, beta)
+            except np.linalg.LinAlgError:
+                damping *= 10
+                continue
+            trial = params + step
+            if np.all(trial[[1, 3, 5]] > 0) and trial[0] > 0:
+                trial_residuals, trial_jacobian, trial_chi2 = evaluate(trial)
+                if trial_chi2 <= chi2:
+                    converged = chi2 - trial_chi2 <= tolerance * chi2
+                    params, residuals, jacobian, chi2 = \
+                        trial, trial_residuals, trial_jacobian, trial_chi2
+                    damping = max(damping / 10, 1e-12)
+                    break
+            damping *= 10
+        else:
+            converged = True
+        if converged:
+            break
+
+    ndf = max(len(x) - len(PARAMETERS), 1)
+    try:
+        covariance = np.linalg.inv(jacobian.dot(jacobian.T))
+        errors = np.sqrt(np.abs(np.diag(covariance)))
+    except np.linalg.LinAlgError:
+        errors = np.full(len(PARAMETERS), np.nan)
+
+    retval = dict(zip(PARAMETERS, params))
+    retval.update({name + '_err': error for name, error in
+                   zip(PARAMETERS, errors)})
+    retval[u'used_gaussians'] = n_gaussians
+    retval[u'gain'] = params[4] * 1e-12 / ELEMENTARY_CHARGE
+    retval[u'gain_err'] = errors[4] * 1e-12 / ELEMENTARY_CHARGE
+    retval[u'chi2'] = chi2
+    retval[u'ndf'] = ndf
+    retval[u'iterations'] = iteration
+    return retval
+
+
+def fit_pmt_data(pmt_data, voltages=None, **kwargs):
+    '''
+    Fit the charge histograms of a PmtData file and store the results with
+    ``PmtData.add_fit_results``
+
+    Parameters
+    ----------
+    pmt_data : PmtData
+    voltages : list of float, optional
+        high voltages to fit, all voltages with a histogram by default
+    kwargs
+        further arguments of ``fit_charge_spectrum``
+
+    Returns
+    -------
+    results : dict
+        fit results per high voltage
+
+    '''
+    if voltages is None:
+        voltages = pmt_data.get_histogram_voltages()
+    retval = dict()
+    for hv in voltages:
+        x, y = pmt_data.get_histogram(hv)
+        results = fit_charge_spectrum(x, y, **kwargs)
+        pmt_data.add_fit_results(hv, results[u'used_gaussians'],
+                                 results[u'nphe'], results[u'q0'],
+                                 results[u'q0sigma'], results[u'q1'],
+                                 results[u'q1sigma'], results[u'gain'],
+                                 results[u'gain_err'])
+        retval[hv] = results
+    return retval
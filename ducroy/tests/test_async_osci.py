@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from ducroy.async_osci import AsyncOsci, VICP_HEADER, VICP_DATA, VICP_EOI
+from ducroy.simulator import SimulatedWaverunner
+
+
+async def _vicp_server(answers):
+    finished = []
+
+    async def handle(reader, writer):
+        done = asyncio.get_event_loop().create_future()
+        finished.append(done)
+        while True:
+            try:
+                header = await reader.readexactly(VICP_HEADER.size)
+            except asyncio.IncompleteReadError:
+                break
+            length = VICP_HEADER.unpack(header)[-1]
+            command = (await reader.readexactly(length)).decode('ascii')
+            if command in answers:
+                await asyncio.sleep(0.05)
+                data = answers[command].encode('ascii')
+                writer.write(VICP_HEADER.pack(VICP_DATA | VICP_EOI, 1, 1, 0,
+                                              len(data)) + data)
+                await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+        done.set_result(None)
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    server.finished = finished
+    return server
+
+
+class TestAsyncOsci(unittest.TestCase):
+    @patch('visa.ResourceManager')
+    def test_query_does_not_block_loop(self, rm_mock):
+        async def run():
+            server = await _vicp_server({'TDIV?': 'TDIV 1.00E-08 S\n'})
+            port = server.sockets[0].getsockname()[1]
+            osci = AsyncOsci('127.0.0.1')
+            osci.connection.port = port
+            ticks = []
+
+            async def ticker():
+                for _ in range(5):
+                    ticks.append(None)
+                    await asyncio.sleep(0.005)
+
+            async with osci:
+                timebase, _ = await asyncio.gather(osci.get_timebase(),
+                                                   ticker())
+            await asyncio.gather(*server.finished)
+            server.close()
+            await server.wait_closed()
+            return timebase, ticks
+
+        loop = asyncio.new_event_loop()
+        timebase, ticks = loop.run_until_complete(run())
+        loop.close()
+        self.assertAlmostEqual(1e-8, timebase)
+        assert 5 == len(ticks)
+
+    @patch('visa.ResourceManager')
+    def test_batch(self, rm_mock):
+        async def run():
+            osci = AsyncOsci('127.0.0.1', timeout=2.)
+            osci.connection.port = simulator.port
+            async with osci:
+                async with osci.batch() as batch:
+                    assert await osci.set_timebase(5e-8) is None
+                    assert await osci.set_channel_vdiv(0.05, 'C1') is None
+            return batch.results
+
+        with SimulatedWaverunner() as simulator:
+            loop = asyncio.new_event_loop()
+            results = loop.run_until_complete(
+                asyncio.wait_for(run(), 5.))
+            loop.close()
+        self.assertAlmostEqual(5e-8, results[0])
+        self.assertAlmostEqual(0.05 / 25, results[1])
+        assert not rm_mock.called
+
+    @patch('visa.ResourceManager')
+    def test_invalid_transport(self, rm_mock):
+        with self.assertRaises(ValueError):
+            AsyncOsci('1', transport='foo')
@@ -4,7 +4,8 @@ import unittest
 
 import numpy as np
 
-from ducroy.binary_reader import read_timetrace
+from ducroy.binary_reader import (read_timetrace, read_timetraces,
+                                  iter_timetrace, read_header, parse_header)
 
 CWD = os.path.join(os.path.dirname(__file__), 'test_data')
 TESTFILENAME = os.path.join(CWD, "test.trc")
@@ -40,3 +41,92 @@ class TestBinaryReader(unittest.TestCase):
         assert np.allclose([71., 71., 70., 71., 71., 71., 69.], y[1, :7])
         assert np.allclose([68., 70.], y[0, 200:202])
         assert np.allclose([68., 69.], y[0, 140:142])
+
+    def test_memmap(self):
+        x, y, v_gain, v_off, h_int, h_off = read_timetrace(TESTFILENAME)
+        x_mm, y_mm, v_gain_mm, _, _, _ = read_timetrace(TESTFILENAME,
+                                                        memmap=True)
+        assert isinstance(y_mm, np.memmap)
+        assert y.shape == y_mm.shape
+        assert x.shape == x_mm.shape
+        assert np.array_equal(y, y_mm)
+        assert v_gain == v_gain_mm
+        assert np.allclose(h_off + h_int * np.arange(3), x_mm[1, :3])
+
+    def test_read_header(self):
+        header = read_header(TESTFILENAME)
+        assert 'LECROY_2_3' == header.template_name
+        assert 'LECROYWR6100' == header.instrument_name
+        assert 500 == header.segments
+        assert 1002 == header.samples
+        assert np.int8 == header.sample_dtype
+        self.assertAlmostEqual(0.00884, header.vertical_gain, 5)
+        self.assertAlmostEqual(2e-10, header.horiz_interval, 11)
+
+    def test_read_header_truncated(self):
+        with self.assertRaises(ValueError):
+            parse_header(b'#9000509346WAVEDESC')
+
+    def test_word_samples(self):
+        with open(TESTFILENAME, 'rb') as fobj:
+            data = bytearray(fobj.read())
+        offset = data.find(b'WAVEDESC')
+        data[offset + 32] = 1  # COMM_TYPE word
+        with tempfile.NamedTemporaryFile(suffix='.trc') as fobj:
+            fobj.write(data)
+            fobj.flush()
+            x, y, _, _, _, _ = read_timetrace(fobj.name)
+            _, y_bytes, _, _, _, _ = read_timetrace(TESTFILENAME)
+        assert (500, 501) == y.shape
+        assert np.array_equal(y_bytes.view('<i2'), y)
+
+    def test_read_timetraces(self):
+        _, y, v_gain, _, h_int, _ = read_timetrace(TESTFILENAME)
+        for processes in (False, True):
+            ys, v_gains, v_offs, h_ints, h_offs = read_timetraces(
+                [TESTFILENAME, TESTFILENAME], processes=processes)
+            assert (1000, 1002) == ys.shape
+            assert np.int8 == ys.dtype
+            assert np.array_equal(y, ys[:500])
+            assert np.array_equal(y, ys[500:])
+            assert np.allclose([v_gain, v_gain], v_gains)
+            assert np.allclose([h_int, h_int], h_ints)
+
+    def test_read_timetraces_glob(self):
+        ys, v_gains, _, _, _ = read_timetraces(os.path.join(CWD, '*.trc'))
+        assert (500, 1002) == ys.shape
+        assert 1 == len(v_gains)
+        with self.assertRaises(ValueError):
+            read_timetraces(os.path.join(CWD, '*.foo'))
+
+    def test_iter_timetrace(self):
+        _, y, v_gain, _, _, _ = read_timetrace(TESTFILENAME)
+        blocks = list(iter_timetrace(TESTFILENAME, 128))
+        assert 4 == len(blocks)
+        assert (116, 1002) == blocks[-1][0].shape
+        assert (116, 2) == blocks[-1][1].shape
+        assert np.array_equal(y, np.concatenate([b[0] for b in blocks]))
+        assert all(v_gain == b[2] for b in blocks)
+        trigtimes = np.concatenate([b[1] for b in blocks])
+        assert np.all(np.diff(trigtimes[:, 0]) > 0)
+
+    def test_trigtimes(self):
+        values = read_timetrace(TESTFILENAME, trigtimes=True)
+        trigtimes = values[-1]
+        assert 7 == len(values)
+        assert (500, 2) == trigtimes.shape
+        assert np.float64 == trigtimes.dtype
+        assert 0 == trigtimes[0, 0]
+        assert np.all(np.diff(trigtimes[:, 0]) > 0)
+        assert np.array_equal(
+            trigtimes, read_timetrace(TESTFILENAME, True, True)[-1])
+
+    def test_trigtimes_truncated(self):
+        header = read_header(TESTFILENAME)
+        with open(TESTFILENAME, 'rb') as fobj:
+            data = fobj.read(header.trigtime_offset + 100)
+        with tempfile.NamedTemporaryFile(suffix='.trc') as fobj:
+            fobj.write(data)
+            fobj.flush()
+            with self.assertRaises(ValueError):
+                read_timetrace(fobj.name, memmap=True, trigtimes=True)
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ducroy.binary_reader import WAVEDESC_DTYPES, read_header
+from ducroy.catalog import TrcCatalog
+
+CWD = os.path.join(os.path.dirname(__file__), 'test_data')
+TESTFILENAME = os.path.join(CWD, "test.trc")
+
+
+class TestTrcCatalog(unittest.TestCase):
+    def test_update_and_query(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for hv in ('1200V', '1300V'):
+                os.mkdir(os.path.join(tmpdir, hv))
+                shutil.copy(TESTFILENAME, os.path.join(tmpdir, hv, 'a.trc'))
+            db = os.path.join(tmpdir, 'index.sqlite')
+            with TrcCatalog(db) as catalog:
+                assert (2, 0) == catalog.update(tmpdir)
+                assert (0, 0) == catalog.update(tmpdir)
+                assert 2 == len(catalog)
+                paths = catalog.query("path LIKE ?", ('%1300V%',),
+                                      segments=500, horiz_interval=2e-10,
+                                      channel='C1')
+                assert [os.path.join(tmpdir, '1300V', 'a.trc')] == paths
+                assert [] == catalog.query(segments=100)
+                assert 2 == len(catalog.query(
+                    trigger_datetime=('2017-12-12', '2017-12-13')))
+                header = catalog.get_header(paths[0])
+                assert 1002 == header['samples']
+                with self.assertRaises(ValueError):
+                    catalog.query(foo=1)
+
+                os.remove(os.path.join(tmpdir, '1200V', 'a.trc'))
+            with TrcCatalog(db) as catalog:
+                assert (0, 1) == catalog.update(tmpdir)
+                assert 1 == len(catalog)
+
+    def test_invalid_trigger_time(self):
+        header = read_header(TESTFILENAME)
+        trigger_time = WAVEDESC_DTYPES['<'].fields['trigger_time']
+        position = header.offset + trigger_time[1] + \
+            trigger_time[0].fields['months'][1]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'a.trc')
+            shutil.copy(TESTFILENAME, filename)
+            with open(filename, 'r+b') as fid:
+                fid.seek(position)
+                fid.write(b'\x00')
+            with TrcCatalog(os.path.join(tmpdir, 'index.sqlite')) as catalog:
+                assert (1, 0) == catalog.update(tmpdir)
+                header = catalog.get_header(filename)
+                assert header['trigger_datetime'] is None
+                assert 1002 == header['samples']
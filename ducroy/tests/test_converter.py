@@ -0,0 +1,110 @@
+import os
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+from ducroy.binary_reader import WAVEDESC_DTYPES, read_header, read_timetrace
+from ducroy.converter import convert_trc_to_hdf5, _same_calibration
+from ducroy.pmt_data import PmtData
+
+CWD = os.path.join(os.path.dirname(__file__), 'test_data')
+TESTFILENAME = os.path.join(CWD, "test.trc")
+
+
+def _write_segment(filename, segment):
+    """Write one segment of the test file as a file without sequence"""
+    header = read_header(TESTFILENAME)
+    with open(TESTFILENAME, 'rb') as fobj:
+        data = fobj.read()
+    dtype = WAVEDESC_DTYPES[header.endianness]
+    record = np.frombuffer(data, dtype, 1, header.offset).copy()
+    record['nom_subarray_count'] = record['subarray_count'] = 1
+    record['wave_array_1'] = record['wave_array_count'] = header.samples
+    record['trigtime_array'] = 16
+    start = header.trigtime_offset + 16 * segment
+    first = header.data_offset + header.samples * segment
+    with open(filename, 'wb') as fobj:
+        fobj.write(data[:header.offset] + record.tobytes() +
+                   data[header.offset + dtype.itemsize:
+                        header.trigtime_offset] +
+                   data[start:start + 16] +
+                   data[first:first + header.samples])
+
+
+class TestConverter(unittest.TestCase):
+    def test_convert_and_append(self):
+        _, y, v_gain, _, h_int, _ = read_timetrace(TESTFILENAME)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fp = os.path.join(tmpdir, 'test.h5')
+            stats = convert_trc_to_hdf5([TESTFILENAME] * 3, fp, 1300, 'a',
+                                        max_workers=2)
+            assert 3 == stats['files']
+            assert 1500 == stats['waveforms']
+            convert_trc_to_hdf5(TESTFILENAME, fp, 1300, 'a', max_workers=1)
+            with h5py.File(fp, "r") as file:
+                group = file['/raw_data/1300V/a']
+                data = group['data']
+                assert (2000, 1002) == data.shape
+                assert 'gzip' == data.compression
+                assert data.maxshape[0] is None
+                assert np.array_equal(y, data[1500:])
+                assert np.array_equal(y, data[:500])
+                self.assertAlmostEqual(v_gain, group.attrs['vertical_gain'])
+                self.assertAlmostEqual(h_int,
+                                       group.attrs['horizontal_interval'])
+
+    def test_single_segment_files(self):
+        _, y, _, _, _, _ = read_timetrace(TESTFILENAME)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filenames = [os.path.join(tmpdir, '{:03d}.trc'.format(i))
+                         for i in range(20)]
+            for i, filename in enumerate(filenames):
+                _write_segment(filename, i)
+            fp = os.path.join(tmpdir, 'test.h5')
+            convert_trc_to_hdf5(filenames, fp, 1300, 'a', max_workers=2)
+            with h5py.File(fp, "r") as file:
+                data = file['/raw_data/1300V/a/data']
+                assert data.chunks[0] > 1
+                assert np.array_equal(y[:20], data[()])
+
+    def test_append_to_pmt_data(self):
+        _, y, v_gain, _, h_int, _ = read_timetrace(TESTFILENAME)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cwd = os.getcwd()
+            os.chdir(tmpdir)
+            try:
+                pmt = PmtData('PMT1')
+            finally:
+                os.chdir(cwd)
+            pmt.filepath = fp = os.path.join(tmpdir, 'PMT1.h5')
+            pmt.add_waveforms(1300, 'a', h_int, v_gain, y[:7],
+                              chunk_segments=64)
+            convert_trc_to_hdf5([TESTFILENAME] * 3, fp, 1300, 'a',
+                                max_workers=2)
+            with h5py.File(fp, "r") as file:
+                data = file['/raw_data/1300V/a/data']
+                assert (1507, 1002) == data.shape
+                assert np.array_equal(y[:7], data[:7])
+                for i in range(3):
+                    assert np.array_equal(y, data[7 + 500*i:507 + 500*i])
+
+    def test_calibration_mismatch(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fp = os.path.join(tmpdir, 'test.h5')
+            convert_trc_to_hdf5(TESTFILENAME, fp, 1300, 'a', max_workers=1)
+            with h5py.File(fp, "r+") as file:
+                attrs = file['/raw_data/1300V/a'].attrs
+                attrs['horizontal_interval'] *= 2
+            with self.assertRaises(ValueError):
+                convert_trc_to_hdf5(TESTFILENAME, fp, 1300, 'a',
+                                    max_workers=1)
+            with h5py.File(fp, "r") as file:
+                assert 500 == len(file['/raw_data/1300V/a/data'])
+
+    def test_same_calibration(self):
+        assert _same_calibration((1e-3, 0., 2e-10, -1e-8),
+                                 (1e-3, 0., 2e-10, -1e-8))
+        assert not _same_calibration((1e-3, 0., 2e-10, -1e-8),
+                                     (1e-3, 0., 4e-10, -1e-8))
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+
+import unittest
+
+import numpy as np
+
+from ducroy.features import FeatureExtractor
+
+
+class TestFeatureExtractor(unittest.TestCase):
+    def test_negative_pulses(self):
+        waveforms = np.full((2, 20), 3, dtype=np.int8)
+        waveforms[0, 10:13] = [-7, -17, -7]
+        features = FeatureExtractor((0, 5), (8, 16), threshold=5)(waveforms)
+        np.testing.assert_array_equal([3, 3], features['pedestal'])
+        np.testing.assert_array_equal([40, 0], features['charge'])
+        np.testing.assert_array_equal([20, 0], features['amplitude'])
+        assert 11 == features['peak_sample'][0]
+        np.testing.assert_array_equal([3, 0],
+                                      features['time_over_threshold'])
+
+    def test_positive_pulses(self):
+        waveforms = np.zeros((1, 10), dtype=np.int8)
+        waveforms[0, 6] = 9
+        features = FeatureExtractor((0, 4), (4, 10), polarity=1)(waveforms)
+        assert 9 == features['charge'][0] == features['amplitude'][0]
+        assert 6 == features['peak_sample'][0]
+        assert 1 == features['time_over_threshold'][0]
+        with self.assertRaises(ValueError):
+            FeatureExtractor((0, 4), (4, 10), polarity=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
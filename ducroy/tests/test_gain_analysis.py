@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from ducroy.gain_analysis import analyse_directory, fit_gain_curve
+from ducroy.pmt_data import PmtData
+
+
+def _waveforms(amplitude, seed, n=20000, samples=100):
+    rng = np.random.RandomState(seed)
+    npe = rng.poisson(0.5, n)
+    shape = np.exp(-0.5 * ((np.arange(samples) - 50) / 2.)**2)
+    data = 1.5 * rng.standard_normal((n, samples)) - \
+        (amplitude * npe * (1 + 0.3 * rng.standard_normal(n)))[:, None] * shape
+    return np.clip(np.round(data), -128, 127).astype(np.int8)
+
+
+class TestGainAnalysis(unittest.TestCase):
+    def test_fit_gain_curve(self):
+        voltages = np.array([1000., 1100., 1200.])
+        a, b, covariance = fit_gain_curve(voltages, 2e-15 * voltages**7,
+                                          [1e4, 1e4, 1e4])
+        self.assertAlmostEqual(7., b)
+        self.assertAlmostEqual(2e-15, a, delta=1e-20)
+        assert (2, 2) == covariance.shape
+
+    def test_analyse_directory(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.chdir(tmpdir)
+            try:
+                for serial in ('PMT1', 'PMT2'):
+                    pmt = PmtData(serial, nominal_voltage=1100)
+                    for seed, hv in enumerate((1000, 1100, 1200)):
+                        pmt.add_waveforms(hv, 'spe', 1e-9, 1e-3, _waveforms(
+                            8 * (hv / 1000.)**7, seed))
+                results = analyse_directory(tmpdir, (0, 30), (40, 60),
+                                            bins=150, max_workers=2)
+            finally:
+                os.chdir(cwd)
+
+            assert 2 == len(results)
+            filepath = os.path.join(tmpdir, 'PMT1.h5')
+            result = results[filepath]
+            assert [1000, 1100, 1200] == sorted(result['fits'])
+            self.assertAlmostEqual(7., result['b'], delta=1.)
+            self.assertAlmostEqual(result['fits'][1100]['gain'],
+                                   result['measured_nominal_gain'],
+                                   delta=0.05 * result['fits'][1100]['gain'])
+            pmt = PmtData.read_from_file(filepath)
+            self.assertAlmostEqual(result['measured_nominal_voltage'],
+                                   pmt.measured_nominal_voltage)
+            assert 0 < pmt.measured_nominal_voltage_error < 50
+            assert 0 < pmt.measured_nominal_gain_error
+            voltages, gains = pmt.get_gains_and_voltages()
+            assert [1000, 1100, 1200] == voltages
+            assert gains[0] < gains[1] < gains[2]
+            assert (2, 150) == pmt.get_histogram(1000).shape
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+
+from ducroy.multi_osci import OsciGroup
+from ducroy.pmt_data import PmtData
+
+
+def _block(data):
+    data = bytes(data)
+    header = "C1:WF DAT1,#9{:09d}".format(len(data))
+    return header.encode('ascii') + data + b'\n'
+
+
+class TestOsciGroup(unittest.TestCase):
+    @patch('visa.ResourceManager')
+    @patch('ducroy.osci_control.tqdm_notebook', new=lambda x: x)
+    def test_aquire_waveforms(self, rm_mock):
+        group = OsciGroup(['1', '2', '3'])
+        for i, osci in enumerate(group.oscis):
+            osci.visa_if = MagicMock()
+            osci.visa_if.read_raw.side_effect = [
+                _block(np.full((4, 3), i, dtype=np.int8))] * 2
+            osci.set_sequence_mode = MagicMock(return_value=4)
+            osci.set_trigger_source = MagicMock()
+            osci.get_horizontal_interval = MagicMock(return_value=1e-10)
+            osci.get_channel_gain = MagicMock(return_value=0.01)
+            osci._segments = 4
+        pmt_data = [MagicMock() for _ in group.oscis]
+        sequences = group.aquire_waveforms(['C1'], 8, shared_trigger='EX',
+                                           pmt_data=pmt_data, hv=1300)
+        for i, (ip, osci) in enumerate(zip(group.ips, group.oscis)):
+            assert (8, 3) == sequences[ip]['C1'].shape
+            assert np.all(i == sequences[ip]['C1'])
+            osci.set_trigger_source.assert_called_with('EX')
+            assert osci.arm_barrier is None
+            args = pmt_data[i].add_waveforms.call_args[0]
+            assert (1300, 'waveforms', 1e-10, 0.01) == args[:4]
+            assert (4, 3) == args[4].shape
+            assert 1 == pmt_data[i].append_waveforms.call_count
+            assert 8 == group.acquisition_stats[ip]['waveforms']
+            assert 24 == group.acquisition_stats[ip]['bytes']
+
+    @patch('visa.ResourceManager')
+    @patch('ducroy.osci_control.tqdm_notebook', new=lambda x: x)
+    def test_stream_to_pmt_data(self, rm_mock):
+        group = OsciGroup(['1', '2'])
+        for i, osci in enumerate(group.oscis):
+            osci.visa_if = MagicMock()
+            osci.visa_if.read_raw.side_effect = [
+                _block(np.full((4, 3), 2*i + loop, dtype=np.int8))
+                for loop in range(2)]
+            osci.set_sequence_mode = MagicMock(return_value=4)
+            osci.get_horizontal_interval = MagicMock(return_value=1e-10)
+            osci.get_channel_gain = MagicMock(return_value=0.01)
+            osci._segments = 4
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.chdir(tmpdir)
+            try:
+                pmt_data = [PmtData('PMT{}'.format(i)) for i in range(2)]
+                sequences = group.aquire_waveforms(
+                    ['C1'], 8, pmt_data=pmt_data, hv=1300, pipelined=True,
+                    keep=False)
+                for i, (ip, pmt) in enumerate(zip(group.ips, pmt_data)):
+                    assert {} == sequences[ip]
+                    assert 8 == group.acquisition_stats[ip]['waveforms']
+                    with pmt.get_waveforms(1300, 'waveforms') as waveforms:
+                        assert 0.01 == waveforms.vertical_gain
+                        assert np.all(2*i == waveforms[:4])
+                        assert np.all(2*i + 1 == waveforms[4:])
+
+                group.aquire_waveforms(['C1'], 0, pmt_data=pmt_data,
+                                       hv=1300, name='empty')
+                with pmt_data[0].get_waveforms(1300, 'empty') as waveforms:
+                    assert (0, 0) == waveforms.shape
+            finally:
+                os.chdir(cwd)
+
+    @patch('visa.ResourceManager')
+    def test_missing_hv(self, rm_mock):
+        group = OsciGroup(['1'])
+        with self.assertRaises(ValueError):
+            group.aquire_waveforms(['C1'], 1, pmt_data=[MagicMock()])
@@ -4,9 +4,10 @@ import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 
+import h5py
 import numpy as np
 
-from ducroy.osci_control import Osci, OPEN_CMD
+from ducroy.osci_control import Osci, OPEN_CMD, decode_binary_block
 
 
 class TestOsci(unittest.TestCase):
@@ -55,3 +56,153 @@ class TestOsci(unittest.TestCase):
             assert file_data['horizontal_interval'] == h_int 
             assert file_data['vertical_gain'] == v_gain
             assert file_data['comment'] == comment
+
+    @patch('visa.ResourceManager')
+    @patch('ducroy.osci_control.tqdm_notebook', new=lambda x: x)
+    def test_aquire_waveforms(self, rm_mock):
+        osci = Osci('1')
+        readouts = [np.full((5, 3), i, dtype=np.int8) for i in range(4)]
+        osci.visa_if = MagicMock()
+        osci.visa_if.read_raw.side_effect = [_block(r) for r in readouts]
+        osci.set_sequence_mode = MagicMock(return_value=5)
+        osci._segments = 5
+        osci.record_waveforms = MagicMock()
+        sequences = osci.aquire_waveforms(['C1', 'C2'], 10)
+        assert 2 == osci.record_waveforms.call_count
+        for channel, offset in (('C1', 0), ('C2', 1)):
+            assert np.int8 == sequences[channel].dtype
+            assert (10, 3) == sequences[channel].shape
+            assert np.all(offset == sequences[channel][:5])
+            assert np.all(offset + 2 == sequences[channel][5:])
+
+    @patch('visa.ResourceManager')
+    @patch('ducroy.osci_control.tqdm_notebook', new=lambda x: x)
+    def test_aquire_waveforms_pipelined(self, rm_mock):
+        osci = Osci('1')
+        readouts = [np.full((5, 3), i, dtype=np.int8) for i in range(6)]
+        osci.visa_if = MagicMock()
+        osci.visa_if.read_raw.side_effect = [_block(r) for r in readouts]
+        osci.set_sequence_mode = MagicMock(return_value=5)
+        osci._segments = 5
+        callback = MagicMock()
+        sequences = osci.aquire_waveforms(['C1', 'C2'], 15, pipelined=True,
+                                          callback=callback)
+        assert 6 == callback.call_count
+        for channel, offset in (('C1', 0), ('C2', 1)):
+            assert (15, 3) == sequences[channel].shape
+            for loop in range(3):
+                block = sequences[channel][loop * 5:(loop + 1) * 5]
+                assert np.all(offset + 2 * loop == block)
+        assert 3 == osci.acquisition_stats['loops']
+        assert 'saved_dead_time' in osci.acquisition_stats
+
+    @patch('visa.ResourceManager')
+    def test_cache(self, rm_mock):
+        osci = Osci('1', cache=True)
+        osci.visa_if = MagicMock()
+        answers = {"TRSE?": "TRSE EDGE,SR,C1,HT,OFF",
+                   "C1:TRSL?": "C1:TRSL POS",
+                   "C2:TRSL?": "C2:TRSL NEG",
+                   "C1:VDIV?": "C1:VDIV 1.00E-01 V"}
+        osci.visa_if.query.side_effect = answers.get
+        assert 'POS' == osci.get_trigger_slope()
+        assert 'POS' == osci.get_trigger_slope()
+        assert 'C1' == osci.get_trigger_source()
+        assert 2 == osci.visa_if.query.call_count
+        osci.set_trigger_source('C2')
+        assert 'NEG' == osci.get_trigger_slope()
+        assert 3 == osci.visa_if.query.call_count
+        assert 0.1 == osci.get_channel_vdiv('C1')
+        osci.record_waveforms()
+        osci.get_channel_vdiv('C1')
+        assert 4 == osci.visa_if.query.call_count
+        osci.write("VDIV", "C1", "2.00E-01", "V")
+        osci.get_channel_vdiv('C1')
+        assert 5 == osci.visa_if.query.call_count
+        osci.write("*RST")
+        assert {} == osci.cache
+
+    @patch('visa.ResourceManager')
+    def test_batch(self, rm_mock):
+        osci = Osci('1')
+        osci.visa_if = MagicMock()
+        answers = {
+            'TDIV 1.00E-08;C1:VDIV 1.00E-01V;TRSE?': 'TRSE EDGE,SR,C1,HT,OFF',
+            'TDIV?;C1:INSP? "VERTICAL_GAIN";TRSE?':
+                'TDIV 1.00E-08 S;C1:INSP "VERTICAL_GAIN : 1.5625E-03";'
+                'TRSE EDGE,SR,C2,HT,OFF\n',
+            'C2:TRSL?': 'C2:TRSL NEG',
+        }
+        osci.visa_if.query.side_effect = answers.get
+        with osci.batch() as batch:
+            assert osci.set_timebase(1e-8) is None
+            osci.set_channel_vdiv(0.1, 'C1')
+            osci.set_trigger_source('C2')
+            osci.write("TRSL", "C2", "NEG")
+            assert 1 == osci.visa_if.query.call_count
+            osci.set_trigger_slope('NEG', 'C2')
+            osci.visa_if.write.assert_not_called()
+        osci.visa_if.write.assert_called_once_with(
+            'TRSE EDGE,SR,C2,HT,OFF,;C2:TRSL NEG;C2:TRSL NEG')
+        assert 3 == osci.visa_if.query.call_count
+        assert [1e-8, 1.5625e-3, 'C2', 'NEG'] == batch.results
+
+    @patch('visa.ResourceManager')
+    @patch('ducroy.osci_control.tqdm_notebook', new=lambda x: x)
+    def test_stream_waveforms_to_file(self, rm_mock):
+        osci = Osci('1')
+        readouts = [np.full((5, 3), i, dtype=np.int8) for i in range(6)]
+        osci.visa_if = MagicMock()
+        osci.visa_if.read_raw.side_effect = [_block(r) for r in readouts]
+        osci.set_sequence_mode = MagicMock(return_value=5)
+        osci.get_channel_gain = MagicMock(return_value=0.5)
+        osci.get_horizontal_interval = MagicMock(return_value=1e-10)
+        osci._segments = 5
+        with tempfile.NamedTemporaryFile(suffix='.h5') as fobj:
+            written = osci.stream_waveforms_to_file(
+                fobj.name, ['C1', 'C2'], 15, comment='a')
+            assert {'C1': 15, 'C2': 15} == written
+            with h5py.File(fobj.name, "r") as file:
+                assert 1e-10 == file.attrs['horizontal_interval']
+                data = file['waveforms_C2']
+                assert data.maxshape[0] is None
+                assert 0.5 == data.attrs['vertical_gain']
+                assert np.all(5 == data[10:])
+                assert np.all(1 == data[:5])
+            with self.assertRaises(ValueError):
+                osci.stream_waveforms_to_file(fobj.name, 'C1', 15,
+                                              queue_size=0)
+
+    def test_decode_binary_block(self):
+        data = np.arange(-5, 5, dtype=np.int8)
+        assert np.array_equal(data, decode_binary_block(_block(data)))
+        with self.assertRaises(ValueError):
+            decode_binary_block(_block(data)[:-5])
+        with self.assertRaises(ValueError):
+            decode_binary_block(b'C1:WF DAT1,')
+
+    @patch('visa.ResourceManager')
+    def test_get_waveform_memory(self, rm_mock):
+        osci = Osci('1')
+        data = np.arange(12, dtype=np.int8).reshape(3, 4)
+        osci.visa_if = MagicMock()
+        osci.visa_if.query.return_value = "SEQ ON,3,1000"
+        osci.visa_if.read_raw.return_value = _block(data)
+        assert np.array_equal(data, osci.get_waveform_memory('C1'))
+        out = np.zeros((3, 4), dtype=np.int8)
+        assert out is osci.get_waveform_memory('C2', out=out)
+        assert np.array_equal(data, out)
+        osci.visa_if.write.assert_called_with("C2:WF? DAT1")
+        assert 1 == osci.visa_if.query.call_count
+
+        osci.visa_if.query.return_value = "SEQ ON,5,1000"
+        osci.write("SEQ", value="ON,5")
+        with self.assertRaises(ValueError):
+            osci.get_waveform_memory('C1')
+        assert 2 == osci.visa_if.query.call_count
+
+
+def _block(data):
+    data = bytes(data)
+    header = "C1:WF DAT1,#9{:09d}".format(len(data))
+    return header.encode('ascii') + data + b'\n'
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import h5py
+import numpy as np
+
+from ducroy.pmt_data import PmtData
+
+
+class TestPmtData(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmpdir.name)
+        self.pmt = PmtData('PMT1', nominal_voltage=1100)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def test_session(self):
+        with patch('ducroy.pmt_data.h5py.File', wraps=h5py.File) as opened:
+            with PmtData.read_from_file(self.pmt.filepath) as pmt:
+                assert 1100 == pmt.nominal_voltage
+                pmt.measured_nominal_gain = 2e6
+                pmt.add_fit_results(1000, 3, 0.5, 0.1, 0.02, 0.5, 0.15,
+                                    3e6, 1e4)
+                pmt.add_histogram(1000, np.arange(3), np.ones(3))
+                assert 2e6 == pmt.measured_nominal_gain
+                assert 0.5 == pmt.get_fit_results(1000)['q1']
+                assert ([1000], [3e6]) == pmt.get_gains_and_voltages()
+                assert 'PMT1' == pmt.serial
+            assert 1 == opened.call_count
+
+        assert 2e6 == self.pmt.measured_nominal_gain
+        assert 0.15 == self.pmt.get_fit_results(1000)['q1sigma']
+        assert [1000] == self.pmt.get_histogram_voltages()
+
+    def test_flush(self):
+        pmt = PmtData.read_from_file(self.pmt.filepath).open()
+        pmt.nominal_gain = 5e6
+        assert 5e6 == pmt.nominal_gain
+        pmt.flush()
+        assert 5e6 == pmt._file.attrs[u'nominal_gain']
+        pmt.close()
+        assert pmt._file is None
+        assert 5e6 == self.pmt.nominal_gain
+
+    def test_waveforms(self):
+        rng = np.random.RandomState(0)
+        waveforms = np.round(rng.standard_normal((100, 50))).astype(np.int8)
+        self.pmt.add_waveforms(1000, 'spe', 1e-9, 1e-3, waveforms[:60],
+                               chunk_segments=20)
+        assert 100 == self.pmt.append_waveforms(1000, 'spe', waveforms[60:])
+        with h5py.File(self.pmt.filepath, 'r') as file:
+            dataset = file['raw_data/1000V/spe/data']
+            assert (20, 50) == dataset.chunks
+            assert 'gzip' == dataset.compression
+            np.testing.assert_array_equal(waveforms, dataset[()])
+            assert 1e-3 == file['raw_data/1000V/spe'].attrs['vertical_gain']
+        with self.assertRaises(ValueError):
+            self.pmt.append_waveforms(1000, 'spe', waveforms[:, :10])
+
+        with self.assertRaises(ValueError):
+            self.pmt.add_waveforms(1000, 'spe', 1e-9, 1e-3, waveforms[:10])
+        with h5py.File(self.pmt.filepath, 'r') as file:
+            assert (100, 50) == file['raw_data/1000V/spe/data'].shape
+
+        self.pmt.add_waveforms(1000, 'spe', 1e-9, 1e-3, waveforms[:10],
+                               compression='lzf', overwrite=True)
+        with h5py.File(self.pmt.filepath, 'r') as file:
+            dataset = file['raw_data/1000V/spe/data']
+            assert 'lzf' == dataset.compression
+            assert (10, 50) == dataset.shape
+
+    def test_empty_waveforms(self):
+        self.pmt.add_waveforms(1000, 'spe', 1e-9, 1e-3,
+                               np.empty((0, 0), dtype=np.int8))
+        with h5py.File(self.pmt.filepath, 'r') as file:
+            assert (0, 0) == file['raw_data/1000V/spe/data'].shape
+        self.pmt.add_waveforms(1000, 'spe2', 1e-9, 1e-3,
+                               np.empty((0, 50), dtype=np.int8))
+        assert 3 == self.pmt.append_waveforms(
+            1000, 'spe2', np.zeros((3, 50), dtype=np.int8))
+
+    def test_waveforms_in_session(self):
+        with self.pmt:
+            self.pmt.add_waveforms(1000, 'spe', 1e-9, 1e-3,
+                                   np.zeros((4, 10), dtype=np.int8))
+            waveforms = self.pmt.get_waveforms(1000, 'spe')
+            assert 1e-3 == waveforms.vertical_gain
+            assert 1e-9 == waveforms.horizontal_interval
+
+
+if __name__ == '__main__':
+    unittest.main()
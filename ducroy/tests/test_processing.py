@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+from ducroy.binary_reader import read_timetrace
+from ducroy.processing import (calibrate, baseline, integrate_charge,
+                               amplitude, peak_time, process, pulse_features)
+
+CWD = os.path.join(os.path.dirname(__file__), 'test_data')
+TESTFILENAME = os.path.join(CWD, "test.trc")
+
+
+class TestProcessing(unittest.TestCase):
+    def setUp(self):
+        self.waveforms = np.full((5, 40), 2, dtype=np.int8)
+        self.waveforms[:, 20:23] = [-8, -18, -8]
+        self.waveforms[3, 25] = -30
+
+    def test_kernels(self):
+        waveforms = self.waveforms
+        volts = calibrate(waveforms, 0.01, 0.02, chunk_size=2)
+        assert np.float32 == volts.dtype
+        np.testing.assert_allclose(0.01 * waveforms - 0.02, volts, rtol=1e-6)
+        np.testing.assert_allclose(0., baseline(waveforms, (0, 10), 0.01,
+                                                0.02, chunk_size=2))
+
+        charge = integrate_charge(waveforms, (15, 30), 0.01, 1e-9,
+                                  baseline_window=(0, 10), chunk_size=3)
+        np.testing.assert_allclose([8., 8., 8., 14.4, 8.], charge,
+                                   rtol=1e-5)
+        np.testing.assert_allclose(
+            charge, integrate_charge(waveforms + np.int8(-2), (15, 30), 0.01,
+                                     1e-9), rtol=1e-5)
+
+        heights = amplitude(waveforms, (15, 30), 0.01, (0, 10), chunk_size=2)
+        np.testing.assert_allclose([0.2, 0.2, 0.2, 0.32, 0.2], heights,
+                                   rtol=1e-5)
+        times = peak_time(waveforms, (15, 30), 1e-9, -5e-9, chunk_size=2)
+        np.testing.assert_allclose([16e-9, 16e-9, 16e-9, 20e-9, 16e-9],
+                                   times, rtol=1e-5)
+
+        results = process(waveforms, (0, 10), (15, 30), 0.01, 1e-9,
+                          horizontal_offset=-5e-9, chunk_size=2)
+        np.testing.assert_allclose(charge, results['charge'], rtol=1e-5)
+        np.testing.assert_allclose(heights, results['amplitude'], rtol=1e-5)
+        np.testing.assert_allclose(times, results['peak_time'], rtol=1e-5)
+        np.testing.assert_allclose(0.02, results['baseline'], rtol=1e-5)
+
+    def test_pulse_features(self):
+        pulses = pulse_features(self.waveforms, (0, 10), (15, 30),
+                                chunk_size=2)
+        np.testing.assert_array_equal(2., pulses['pedestal'])
+        np.testing.assert_array_equal([40., 40., 40., 72., 40.],
+                                      pulses['charge'])
+        np.testing.assert_array_equal([20., 20., 20., 32., 20.],
+                                      pulses['amplitude'])
+        np.testing.assert_array_equal([21, 21, 21, 25, 21],
+                                      pulses['peak_sample'])
+        pulses = pulse_features(-self.waveforms, None, (15, 30), polarity=1,
+                                zero_level=-2.)
+        np.testing.assert_array_equal([40., 40., 40., 72., 40.],
+                                      pulses['charge'])
+        self.assertRaises(ValueError, pulse_features, self.waveforms,
+                          (0, 10), (15, 30), 0)
+
+    def test_h5py_dataset(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with h5py.File(os.path.join(tmpdir, 'test.h5'), 'w') as file:
+                dataset = file.create_dataset('data', data=self.waveforms)
+                np.testing.assert_array_equal(
+                    process(self.waveforms, (0, 10), (15, 30), 0.01, 1e-9),
+                    process(dataset, (0, 10), (15, 30), 0.01, 1e-9,
+                            chunk_size=2))
+
+    def test_memmap(self):
+        _, y, v_gain, v_off, h_int, h_off = read_timetrace(TESTFILENAME,
+                                                           memmap=True)
+        results = process(y, (0, 100), (100, 400), v_gain, h_int, v_off,
+                          h_off, chunk_size=64)
+        reference = y[:, 100:400].sum(axis=1) - \
+            y[:, :100].mean(axis=1) * 300.
+        np.testing.assert_allclose(-reference * v_gain * h_int / 50. * 1e12,
+                                   results['charge'], rtol=1e-4, atol=1e-4)
+        np.testing.assert_allclose(y[:, :100].mean(axis=1) * v_gain - v_off,
+                                   results['baseline'], rtol=1e-5, atol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
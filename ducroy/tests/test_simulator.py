@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+import time
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from ducroy.features import FEATURE_DTYPE, FeatureExtractor
+from ducroy.osci_control import Osci
+from ducroy.simulator import SimulatedWaverunner
+from ducroy.transport import VicpTransport
+
+
+@patch('ducroy.osci_control.tqdm_notebook', new=lambda x: x)
+class TestSimulatedWaverunner(unittest.TestCase):
+    def setUp(self):
+        self.simulator = SimulatedWaverunner(samples=202, seed=1)
+        self.simulator.start()
+        self.osci = Osci('127.0.0.1', transport=VicpTransport(
+            '127.0.0.1', self.simulator.port))
+        self.osci._open_resource()
+
+    def tearDown(self):
+        self.osci.visa_if.close()
+        self.simulator.stop()
+
+    def test_settings(self):
+        osci = self.osci
+        assert 10 == osci.set_sequence_mode(10)
+        assert osci.set_sequence_mode(None) is None
+        self.assertAlmostEqual(1e-8, osci.set_timebase(1e-8))
+        self.assertAlmostEqual(0.2 / 25, osci.set_channel_vdiv(0.2, 'C2'))
+        self.assertAlmostEqual(0.2, osci.get_channel_vdiv('C2'))
+        assert 'C2' == osci.set_trigger_source('C2')
+        assert 'POS' == osci.set_trigger_slope('POS')
+        assert '-2.00E-02' == osci.set_trigger_level(-0.02, 'C2')
+        self.assertAlmostEqual(1e-7 / 202, osci.get_horizontal_interval())
+        osci.record_waveforms()
+        assert 1 == osci.get_number_of_sweeps()[0]
+        assert 1 == osci.get_measure('P1')['SWEEPS']
+
+    def test_aquire_waveforms(self):
+        for pipelined in (False, True):
+            sequences = self.osci.aquire_waveforms(['C1', 'C2'], 30,
+                                                   pipelined=pipelined)
+            for channel in ('C1', 'C2'):
+                assert (30, 202) == sequences[channel].shape
+                minimum = sequences[channel].min(axis=1)
+                assert np.any(minimum < -10)
+                assert np.any(minimum > -10)
+
+    def test_aquire_into_sequences(self):
+        read_block = VicpTransport.read_block
+        with patch.object(VicpTransport, 'read_block', autospec=True,
+                          side_effect=read_block) as mock:
+            sequences = self.osci.aquire_waveforms(['C1'], 1000)
+        assert mock.call_args_list[0][1]['out'] is None
+        out = mock.call_args_list[1][1]['out']
+        assert (500, 202) == out.shape
+        assert np.shares_memory(out, sequences['C1'])
+        np.testing.assert_array_equal(self.simulator.waveforms('C1'),
+                                      sequences['C1'][500:])
+
+    def test_sequence_changed_by_write(self):
+        for cache in (False, True):
+            self.osci.cache = dict() if cache else None
+            self.osci.set_sequence_mode(10)
+            self.osci.record_waveforms()
+            assert (10, 202) == self.osci.get_waveform_memory('C1').shape
+            self.osci.write("SEQ", value="ON,4")
+            self.osci.record_waveforms()
+            assert (4, 202) == self.osci.get_waveform_memory('C1').shape
+
+    def test_reduced_transfer(self):
+        sequences = self.osci.aquire_waveforms(['C1'], 20,
+                                               sample_window=(40, 100),
+                                               sparsing=2)
+        assert (20, 30) == sequences['C1'].shape
+        np.testing.assert_array_equal(
+            self.simulator.waveforms('C1')[:, 40:100:2], sequences['C1'])
+
+        sequences = self.osci.aquire_waveforms(['C1', 'C2'], 6,
+                                               segment_range=(2, 4))
+        assert (6, 202) == sequences['C2'].shape
+        np.testing.assert_array_equal(self.simulator.waveforms('C2')[1:4],
+                                      sequences['C2'][3:])
+        # the query waits until the reset has been executed
+        assert 'WFSU SP,0,NP,0,FP,0,SN,0' == \
+            self.osci.visa_if.query('WFSU?').strip()
+        assert {'SP': 0, 'NP': 0, 'FP': 0, 'SN': 0} == \
+            self.simulator.settings['WFSU']
+        for segment_range in ((20, 30), (2, 11), (0, 2), (4, 3)):
+            with self.assertRaises(ValueError):
+                self.osci.aquire_waveforms(['C1'], 10,
+                                           segment_range=segment_range)
+
+    def test_aquire_features(self):
+        reducer = FeatureExtractor((0, 30), (40, 70))
+        features, raw = self.osci.aquire_features(['C1', 'C2'], 30, reducer,
+                                                  raw_prescale=4)
+        assert 30 == len(features['C1'])
+        assert (8, 202) == raw['C2'].shape
+        np.testing.assert_array_equal(
+            reducer(self.simulator.waveforms('C2'))[-10:],
+            features['C2'][-10:])
+        np.testing.assert_array_equal(self.simulator.waveforms('C2')[::4],
+                                      raw['C2'])
+
+    def test_aquire_no_features(self):
+        features, raw = self.osci.aquire_features(
+            'C1', 0, FeatureExtractor((0, 30), (40, 70)))
+        assert FEATURE_DTYPE == features['C1'].dtype
+        assert 0 == len(features['C1'])
+        assert {} == raw
+
+    def test_batch(self):
+        commands = self.simulator.commands
+        with self.osci.batch() as batch:
+            self.osci.set_timebase(5e-8)
+            self.osci.set_channel_vdiv(0.05, 'C1')
+        self.assertAlmostEqual(5e-8, batch.results[0])
+        self.assertAlmostEqual(0.05 / 25, batch.results[1])
+        assert commands + 4 == self.simulator.commands
+
+    def test_measure_in_batch(self):
+        with self.osci.batch():
+            self.osci.set_sequence_mode(10)
+            self.osci.record_waveforms()
+            measure = self.osci.get_measure('P1')
+            sweeps = self.osci.get_number_of_sweeps()
+        assert 10 == measure['SWEEPS']
+        assert 0 == sweeps[0]
+
+    def test_latency(self):
+        self.simulator.latency = 0.05
+        start_time = time.time()
+        self.osci.get_timebase()
+        assert time.time() - start_time >= 0.05
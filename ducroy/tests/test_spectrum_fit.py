@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from ducroy.pmt_data import PmtData
+from ducroy.spectrum_fit import (charge_spectrum, fit_charge_spectrum,
+                                 fit_pmt_data, _model_and_jacobian)
+
+
+def _spectrum(nphe, q1, seed=0):
+    rng = np.random.RandomState(seed)
+    n = rng.poisson(nphe, 100000)
+    charges = rng.normal(0.05, 0.02, len(n)) + n * q1 + \
+        np.sqrt(n) * 0.3 * q1 * rng.standard_normal(len(n))
+    y, edges = np.histogram(charges, bins=200, range=(-0.2, 6 * q1))
+    return (edges[1:] + edges[:-1]) / 2, y
+
+
+class TestSpectrumFit(unittest.TestCase):
+    def test_jacobian(self):
+        x = np.linspace(-0.2, 2., 50)
+        params = np.array([10., 0.8, 0.05, 0.02, 0.5, 0.15])
+        _, jacobian = _model_and_jacobian(x, params, 8)
+        for i in range(len(params)):
+            delta = np.zeros(len(params))
+            delta[i] = 1e-7 * abs(params[i])
+            numerical = (charge_spectrum(x, *(params + delta), 8) -
+                         charge_spectrum(x, *(params - delta), 8)) / \
+                (2 * delta[i])
+            np.testing.assert_allclose(numerical, jacobian[i], rtol=1e-4,
+                                       atol=1e-6 * np.abs(numerical).max())
+
+    def test_fit(self):
+        for nphe in (0.2, 1.2):
+            x, y = _spectrum(nphe, 0.5)
+            results = fit_charge_spectrum(x, y)
+            self.assertAlmostEqual(nphe, results['nphe'], delta=0.02)
+            self.assertAlmostEqual(0.05, results['q0'], delta=0.002)
+            self.assertAlmostEqual(0.5, results['q1'], delta=0.01)
+            self.assertAlmostEqual(0.15, results['q1sigma'], delta=0.01)
+            self.assertAlmostEqual(0.5e-12 / 1.602176634e-19,
+                                   results['gain'], delta=3e5)
+            assert 0 < results['gain_err'] < 1e5
+            assert results['chi2'] / results['ndf'] < 2
+
+    def test_fit_pmt_data(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.chdir(tmpdir)
+            try:
+                pmt = PmtData('PMT1')
+                for hv, q1 in ((1000, 0.3), (1100, 0.6)):
+                    pmt.add_histogram(hv, *_spectrum(0.5, q1))
+                results = fit_pmt_data(pmt)
+                assert [1000, 1100] == sorted(results)
+                stored = pmt.get_fit_results(1100)
+                self.assertAlmostEqual(0.6, stored['q1'], delta=0.01)
+                assert results[1100]['used_gaussians'] == \
+                    stored['used_gaussians']
+                voltages, gains = pmt.get_gains_and_voltages()
+                assert gains[voltages.index(1000)] < \
+                    gains[voltages.index(1100)]
+            finally:
+                os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    unittest.main()
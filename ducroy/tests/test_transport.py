@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+import socket
+import threading
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from ducroy.osci_control import Osci
+from ducroy.transport import (VicpTransport, VICP_HEADER, VICP_DATA,
+                              VICP_EOI, benchmark_transport)
+
+
+def _packets(message, size):
+    pieces = [message[i:i + size] for i in range(0, len(message), size)]
+    return b''.join(
+        VICP_HEADER.pack(VICP_DATA | (VICP_EOI if i == len(pieces) - 1
+                                      else 0), 1, 1, 0, len(piece)) + piece
+        for i, piece in enumerate(pieces))
+
+
+class _VicpServer(threading.Thread):
+    def __init__(self, answers, packet_size=7):
+        super().__init__(daemon=True)
+        self.answers = answers
+        self.packet_size = packet_size
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+
+    def run(self):
+        connection, _ = self.server.accept()
+        stream = connection.makefile('rb')
+        try:
+            while True:
+                header = stream.read(VICP_HEADER.size)
+                if len(header) < VICP_HEADER.size:
+                    break
+                command = stream.read(VICP_HEADER.unpack(header)[-1])
+                if command in self.answers:
+                    connection.sendall(_packets(self.answers[command],
+                                                self.packet_size))
+        except OSError:
+            pass
+        stream.close()
+        connection.close()
+        self.server.close()
+
+
+DATA = np.arange(-60, 60, dtype=np.int8)
+ANSWERS = {
+    b'TDIV?': b'TDIV 1.00E-08 S\n',
+    b'C1:WF? DAT1': b'C1:WF DAT1,#9000000120' + DATA.tobytes() + b'\n',
+    b'SEQ?': b'SEQ ON,4,1000 S',
+}
+
+
+class TestVicpTransport(unittest.TestCase):
+    def setUp(self):
+        self.server = _VicpServer(ANSWERS)
+        self.server.start()
+        self.transport = VicpTransport('127.0.0.1', self.server.port)
+        self.transport.open()
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.join(1)
+
+    def test_query(self):
+        assert 'TDIV 1.00E-08 S\n' == self.transport.query('TDIV?')
+        assert 'TDIV 1.00E-08 S\n' == self.transport.query('TDIV?')
+
+    def test_read_block(self):
+        self.transport.write('C1:WF? DAT1')
+        assert np.array_equal(DATA, self.transport.read_block())
+        out = np.zeros((4, 30), dtype=np.int8)
+        self.transport.write('C1:WF? DAT1')
+        assert out is self.transport.read_block(out=out)
+        assert np.array_equal(DATA, out.ravel())
+        self.transport.write('C1:WF? DAT1')
+        with self.assertRaises(ValueError):
+            self.transport.read_block(out=np.zeros(10, dtype=np.int8))
+        assert 'TDIV 1.00E-08 S\n' == self.transport.query('TDIV?')
+
+    def test_osci(self):
+        osci = Osci('127.0.0.1', transport=self.transport)
+        assert osci.rm is None
+        osci._open_resource()
+        out = np.zeros((4, 30), dtype=np.int8)
+        assert out is osci.get_waveform_memory('C1', out=out)
+        assert np.array_equal(DATA.reshape(4, 30), out)
+        assert np.array_equal(out, osci.get_waveform_memory('C1'))
+        stats = benchmark_transport(osci, repeat=2)
+        assert stats['latency'] > 0
+        assert stats['mb_per_s'] > 0
+
+
+class TestOsciTransport(unittest.TestCase):
+    def test_invalid_transport(self):
+        with self.assertRaises(ValueError):
+            Osci('1', transport='foo')
+
+    @patch('visa.ResourceManager')
+    def test_vicp_without_visa(self, rm_mock):
+        osci = Osci('1', transport='vicp')
+        rm_mock.assert_not_called()
+        assert osci.rm is None
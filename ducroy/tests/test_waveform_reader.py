@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from ducroy.osci_control import Osci
+from ducroy.pmt_data import PmtData
+from ducroy.processing import baseline
+
+
+class TestWaveformDataset(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmpdir.name)
+        rng = np.random.RandomState(0)
+        self.waveforms = np.round(rng.standard_normal((100, 50))).astype(
+            np.int8)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def test_pmt_data(self):
+        pmt = PmtData('PMT1')
+        pmt.add_waveforms(1000, 'spe', 1e-9, 1e-3, self.waveforms,
+                          comment='test', chunk_segments=16)
+        with pmt.get_waveforms(1000, 'spe') as waveforms:
+            assert (100, 50) == waveforms.shape
+            assert 100 == len(waveforms)
+            np.testing.assert_array_equal(self.waveforms[10:20, 5],
+                                          waveforms[10:20, 5])
+            assert 1e-3 == waveforms.vertical_gain
+            assert 0. == waveforms.vertical_offset
+            assert 'test' == waveforms.comment
+            blocks = list(waveforms.iter_chunks(40))
+            assert [0, 32, 64, 96] == [block.start for block in blocks]
+            np.testing.assert_array_equal(
+                self.waveforms, np.concatenate([b.data for b in blocks]))
+            assert 1e-9 == blocks[0].horizontal_interval
+            np.testing.assert_allclose(
+                baseline(self.waveforms, (0, 10)),
+                baseline(waveforms, (0, 10), chunk_size=7))
+
+        with pmt:
+            waveforms = pmt.get_waveforms(1000, 'spe')
+            assert 1 == len(list(waveforms.iter_chunks()))
+            waveforms.close()
+            assert pmt.serial == 'PMT1'
+
+    def test_osci_file(self):
+        Osci.save_waveforms_to_file('test.h5', self.waveforms, 2e-10, 4e-3,
+                                    comment='run 1')
+        with Osci.open_waveforms_file('test.h5') as waveforms:
+            assert 4e-3 == waveforms.vertical_gain
+            assert 2e-10 == waveforms.horizontal_interval
+            blocks = list(waveforms.iter_chunks(30))
+            assert [0, 30, 60, 90] == [block.start for block in blocks]
+            np.testing.assert_array_equal(self.waveforms[90:],
+                                          blocks[-1].data)
+
+
+if __name__ == '__main__':
+    unittest.main()
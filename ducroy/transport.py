@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""
+Transports between Osci and the oscilloscope.
+
+A transport offers the part of the pyvisa resource interface which Osci uses
+(``write``, ``query``, ``read_raw`` and ``close``). Transports with a
+``read_block`` method receive binary waveform blocks directly into NumPy
+memory.
+
+"""
+import socket
+import struct
+import time
+
+import numpy as np
+
+OPEN_CMD = "TCPIP0::{}::INSTR"
+
+VICP_PORT = 1861
+VICP_HEADER = struct.Struct('>BBBBI')
+VICP_VERSION = 1
+VICP_DATA = 0x80
+VICP_REMOTE = 0x40
+VICP_EOI = 0x01
+
+
+class VisaTransport(object):
+    """pyvisa (VXI-11) transport
+
+    Parameters
+    ----------
+    ip : str
+    resource_manager : pyvisa.ResourceManager
+    """
+
+    def __init__(self, ip, resource_manager):
+        self.ip = ip
+        self.resource = resource_manager.open_resource(OPEN_CMD.format(ip))
+
+    def write(self, command):
+        return self.resource.write(command)
+
+    def query(self, command):
+        return self.resource.query(command)
+
+    def read_raw(self):
+        return self.resource.read_raw()
+
+    def close(self):
+        self.resource.close()
+
+
+class VicpTransport(object):
+    """Raw socket transport using the LeCroy VICP protocol
+
+    Every message is split into packets with an 8 byte header (operation,
+    version, sequence number, spare, length). Binary blocks are received
+    with ``socket.recv_into`` without intermediate copies.
+
+    Parameters
+    ----------
+    ip : str
+    port : int, optional
+    timeout : float, optional
+        socket timeout in seconds
+    """
+
+    def __init__(self, ip, port=VICP_PORT, timeout=10.):
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.socket = None
+        self._sequence = 0
+        self._remaining = 0
+        self._eoi = True
+        self._header = bytearray(VICP_HEADER.size)
+
+    def open(self):
+        if self.socket is not None:
+            return
+        self.socket = socket.create_connection((self.ip, self.port),
+                                               self.timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def write(self, command):
+        if isinstance(command, str):
+            command = command.encode('ascii')
+        self._sequence = self._sequence % 255 + 1
+        header = VICP_HEADER.pack(VICP_DATA | VICP_REMOTE | VICP_EOI,
+                                  VICP_VERSION, self._sequence, 0,
+                                  len(command))
+        self.socket.sendall(header + command)
+        self._remaining, self._eoi = 0, False
+
+    def _recv_into(self, view):
+        while len(view):
+            nbytes = self.socket.recv_into(view)
+            if nbytes == 0:
+                raise ConnectionError("Connection closed by the instrument")
+            view = view[nbytes:]
+
+    def _next_packet(self):
+        if self._eoi:
+            raise ValueError("End of message reached")
+        self._recv_into(memoryview(self._header))
+        operation, _, _, _, length = VICP_HEADER.unpack(self._header)
+        self._remaining = length
+        self._eoi = bool(operation & VICP_EOI)
+
+    def _read_into(self, view):
+        """Fill view with the next bytes of the current message"""
+        while len(view):
+            if self._remaining == 0:
+                self._next_packet()
+                continue
+            nbytes = min(len(view), self._remaining)
+            self._recv_into(view[:nbytes])
+            self._remaining -= nbytes
+            view = view[nbytes:]
+
+    def _discard_message(self):
+        while self._remaining or not self._eoi:
+            if self._remaining == 0:
+                self._next_packet()
+                continue
+            self._read_into(memoryview(bytearray(self._remaining)))
+
+    def read_raw(self):
+        """Receive the next message as bytes"""
+        blocks = []
+        while True:
+            self._next_packet()
+            block = bytearray(self._remaining)
+            self._read_into(memoryview(block))
+            blocks.append(block)
+            if self._eoi:
+                return bytes(b''.join(blocks))
+
+    def query(self, command):
+        self.write(command)
+        return self.read_raw().decode('ascii')
+
+    def read_block(self, dtype=np.int8, out=None):
+        """Receive the IEEE 488.2 definite length block of the next message
+        Parameters
+        ----------
+        dtype: data type of the block
+        out: optional C-contiguous array which receives the data, its size
+        has to match the block
+        Returns
+        -------
+        data: out or a new one dimensional array
+        """
+        byte = bytearray(1)
+        for _ in range(64):
+            self._read_into(memoryview(byte))
+            if byte == b'#':
+                break
+        else:
+            raise ValueError("No binary block found")
+        self._read_into(memoryview(byte))
+        digits = bytearray(int(chr(byte[0])))
+        self._read_into(memoryview(digits))
+        length = int(bytes(digits))
+        dtype = np.dtype(dtype)
+        if out is None:
+            out = np.empty(length // dtype.itemsize, dtype)
+        elif out.nbytes != length:
+            # keep the connection in sync for the next message
+            self._discard_message()
+            raise ValueError("Block has {} bytes, out {}".format(
+                length, out.nbytes))
+        self._read_into(memoryview(out).cast('B'))
+        self._discard_message()
+        return out
+
+
+def benchmark_transport(osci, channel='C1', repeat=10):
+    """Measures the command latency and the waveform transfer rate of the
+    transport of an opened Osci
+    Parameters
+    ----------
+    osci: Osci with an opened transport
+    channel: channel whose waveform memory is transferred
+    repeat: number of repetitions
+    Returns
+    -------
+    stats: dict with the median query latency [s] and the transfer rate
+    of the waveform memory [MB/s]
+    """
+    latencies = []
+    for _ in range(repeat):
+        start_time = time.time()
+        osci.visa_if.query("TDIV?")
+        latencies.append(time.time() - start_time)
+
+    out = np.empty_like(osci.get_waveform_memory(channel))
+    nbytes = 0
+    start_time = time.time()
+    for _ in range(repeat):
+        nbytes += osci.get_waveform_memory(channel, out=out).nbytes
+    duration = time.time() - start_time
+    return {'latency': float(np.median(latencies)),
+            'mb_per_s': nbytes / 1e6 / duration if duration else np.inf}
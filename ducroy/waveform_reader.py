@@ -0,0 +1,117 @@
+"""
+Lazy access to waveform datasets in HDF5 files.
+
+``WaveformDataset`` wraps the waveforms written by ``Osci`` or stored in the
+raw_data of ``PmtData`` without loading them. Slices read only the selected
+waveforms, ``iter_chunks`` walks through the dataset in blocks aligned to the
+HDF5 chunks, so the memory stays bounded for datasets of any size. The proxy
+can be passed directly to the functions of ``ducroy.processing``.
+
+"""
+from collections import namedtuple
+
+import h5py
+import numpy as np
+
+BLOCK_BYTES = 2**24
+
+WaveformBlock = namedtuple('WaveformBlock', ['start', 'data', 'vertical_gain',
+                                             'vertical_offset',
+                                             'horizontal_interval',
+                                             'horizontal_offset'])
+
+
+class WaveformDataset(object):
+    """Read-only proxy of a (waveforms, samples) dataset
+
+    The calibration attributes are taken from the group of the dataset and
+    from the dataset itself, the latter take precedence.
+
+    Parameters
+    ----------
+    file : str or h5py.File
+        path of the HDF5 file or an open file, which is not closed by the
+        proxy
+    name : str
+        path of the dataset in the file
+    """
+
+    def __init__(self, file, name):
+        self._owns_file = not isinstance(file, h5py.File)
+        self.file = h5py.File(file, "r") if self._owns_file else file
+        self.dataset = self.file[name]
+        attrs = dict(self.dataset.parent.attrs)
+        attrs.update(self.dataset.attrs)
+        self.attrs = attrs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._owns_file and self.file.id.valid:
+            self.file.close()
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, key):
+        return self.dataset[key]
+
+    @property
+    def shape(self):
+        return self.dataset.shape
+
+    @property
+    def dtype(self):
+        return self.dataset.dtype
+
+    @property
+    def vertical_gain(self):
+        return float(self.attrs[u'vertical_gain'])
+
+    @property
+    def vertical_offset(self):
+        return float(self.attrs.get(u'vertical_offset', 0.))
+
+    @property
+    def horizontal_interval(self):
+        return float(self.attrs[u'horizontal_interval'])
+
+    @property
+    def horizontal_offset(self):
+        return float(self.attrs.get(u'horizontal_offset', 0.))
+
+    @property
+    def comment(self):
+        return str(self.attrs.get(u'comment', ''))
+
+    def iter_chunks(self, n=None):
+        '''
+        Iterate over blocks of waveforms
+
+        Parameters
+        ----------
+        n : int, optional
+            waveforms per block, rounded to a multiple of the HDF5 chunk
+            size. By default blocks of about 16 MB are read.
+
+        Yields
+        ------
+        block : WaveformBlock
+            index of the first waveform, the int8 data and the calibration
+
+        '''
+        rows = self.dataset.chunks[0] if self.dataset.chunks else 1
+        if n is None:
+            row_bytes = max(self.dtype.itemsize * int(np.prod(self.shape[1:])),
+                            1)
+            n = BLOCK_BYTES // row_bytes
+        n = max(n // rows, 1) * rows
+        for start in range(0, len(self), n):
+            yield WaveformBlock(start, self.dataset[start:start + n],
+                                self.vertical_gain, self.vertical_offset,
+                                self.horizontal_interval,
+                                self.horizontal_offset)
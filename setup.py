@@ -20,6 +20,8 @@ setup(name='ducroy',
       ],
       entry_points={
           'console_scripts': [
+              'ducroy-trc2hdf5=ducroy.converter:main',
+              'ducroy-simulator=ducroy.simulator:main',
           ],
       },
       classifiers=[